@@ -0,0 +1,153 @@
+# ============================
+# AI 助手对话管线（DeepSeek，OpenAI 兼容接口）
+# 持仓压缩成固定格式的表格；历史对话按 token 预算裁剪；回答以流式返回
+# ============================
+import os
+from typing import TYPE_CHECKING, Dict, Iterator, List
+
+# openai SDK 导入较慢，只在第一次创建客户端时加载（聊天面板没用到时不影响冷启动）
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+DEEPSEEK_BASE_URL = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+DEEPSEEK_MODEL = "deepseek-chat"
+
+# 发送给模型的上下文上限（估算 token 数，含系统提示）
+CONTEXT_TOKEN_BUDGET = 6000
+# 其中留给持仓表的份额：超出时只列占比最高的基金，其余合并为一行，系统提示不随持仓数增长
+HOLDINGS_TOKEN_BUDGET = 2000
+# 被裁掉的早期提问在摘要里最多保留的字符数
+SUMMARY_CHARS = 300
+
+# 持仓表的列及格式（顺序固定，保证同样的持仓得到同样的文本）
+HOLDING_FIELDS = [
+    ("代码", "{}"),
+    ("基金名称", "{}"),
+    ("占比", "{:.2f}%"),
+    ("持有金额", "{:.2f}"),
+    ("涨幅", "{:+.2f}%"),
+    ("当日收益", "{:+.2f}"),
+    ("累计收益", "{:+.2f}"),
+    ("收益率", "{:+.2f}%"),
+]
+# 全家汇总视图的持仓带 账户 列，同一基金可能出现在多个账户下，此时放在表格第一列
+ACCOUNT_FIELD = ("账户", "{}")
+# 合并行中可直接相加的列
+SUMMABLE_FIELDS = ("占比", "持有金额", "当日收益", "累计收益")
+
+
+def make_client(api_key: str) -> "OpenAI":
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, base_url=DEEPSEEK_BASE_URL)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符按 1 个计，其余字符按 4 个 1 token 计"""
+    cjk = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _number(value) -> float:
+    """缺失或 NaN 记为 0"""
+    return 0.0 if value is None or value != value else float(value)
+
+
+def _format_row(item: Dict, fields) -> str:
+    cells = []
+    for name, fmt in fields:
+        value = item.get(name)
+        if value is None or value != value:  # 缺失或 NaN
+            cells.append("-")
+            continue
+        try:
+            cells.append(fmt.format(value))
+        except (TypeError, ValueError):
+            cells.append("-")
+    return "|".join(cells)
+
+
+def _rest_row(items: List[Dict]) -> Dict:
+    """被省略的基金合并为一行：金额与占比相加，涨幅 / 收益率不可加，留空"""
+    row = {"代码": "其余", "基金名称": f"其余 {len(items)} 只合计"}
+    for name in SUMMABLE_FIELDS:
+        row[name] = sum(_number(item.get(name)) for item in items)
+    return row
+
+
+def format_holdings_table(view_data: List[Dict], budget: int = HOLDINGS_TOKEN_BUDGET) -> str:
+    """
+    把持仓明细压缩成按（账户、）代码排序的竖线分隔表格。
+
+    超出 budget（估算 token）时按占比从高到低保留能放下的基金，其余合并为末尾一行 “其余 N 只合计”。
+    """
+    fields = HOLDING_FIELDS
+    if any(ACCOUNT_FIELD[0] in item for item in view_data):
+        fields = [ACCOUNT_FIELD] + HOLDING_FIELDS
+    header = "|".join(name for name, _ in fields)
+
+    ranked = sorted(view_data, key=lambda x: (-_number(x.get("占比")), str(x.get("账户", "")), str(x["代码"])))
+    rows = [_format_row(item, fields) for item in ranked]
+    used = estimate_tokens(header) + sum(estimate_tokens(r) + 1 for r in rows)
+    keep = len(rows)
+    if used > budget:
+        # 预留合并行的位置（按全部基金合计估算，数字位数只会更多）
+        used = estimate_tokens(header) + estimate_tokens(_format_row(_rest_row(ranked), fields)) + 1
+        keep = 0
+        while keep < len(rows) and used + estimate_tokens(rows[keep]) + 1 <= budget:
+            used += estimate_tokens(rows[keep]) + 1
+            keep += 1
+
+    kept = sorted(range(keep), key=lambda i: (str(ranked[i].get("账户", "")), str(ranked[i]["代码"])))
+    lines = [header] + [rows[i] for i in kept]
+    if keep < len(ranked):
+        lines.append(_format_row(_rest_row(ranked[keep:]), fields))
+    return "\n".join(lines)
+
+
+def build_system_prompt(username: str, view_data: List[Dict], totals: Dict[str, float]) -> str:
+    return (
+        f"你是专业基金助手，分析 {username} 的资产。"
+        f"总资产 {totals['total_v']:.2f}，当日盈亏 {totals['total_d']:+.2f}，累计盈亏 {totals['total_h']:+.2f}。\n"
+        f"持仓明细:\n{format_holdings_table(view_data)}"
+    )
+
+
+def build_messages(system_prompt: str, history: List[Dict], budget: int = CONTEXT_TOKEN_BUDGET) -> List[Dict]:
+    """
+    组装发送给模型的消息：系统提示 + 预算内尽量多的最近对话。
+
+    系统提示中的持仓表已限制在 HOLDINGS_TOKEN_BUDGET 以内，历史对话使用其余的预算。
+
+    最新一条消息总会保留；放不下的早期对话替换为一条简短摘要（只保留用户提问要点）。
+    """
+    used = estimate_tokens(system_prompt)
+    kept = []
+    for i in range(len(history) - 1, -1, -1):
+        cost = estimate_tokens(history[i]["content"]) + 4
+        if kept and used + cost > budget:
+            dropped = history[:i + 1]
+            break
+        kept.append(history[i])
+        used += cost
+    else:
+        dropped = []
+    kept.reverse()
+
+    messages = [{"role": "system", "content": system_prompt}]
+    if dropped:
+        asked = "；".join(m["content"].strip().replace("\n", " ") for m in dropped if m["role"] == "user")
+        if len(asked) > SUMMARY_CHARS:
+            asked = asked[:SUMMARY_CHARS] + "…"
+        messages.append({
+            "role": "system",
+            "content": f"（更早的 {len(dropped)} 条对话已省略。用户此前问过：{asked or '无'}）",
+        })
+    return messages + kept
+
+
+def stream_reply(client: "OpenAI", messages: List[Dict], model: str = DEEPSEEK_MODEL) -> Iterator[str]:
+    """流式请求回答，逐段产出文本"""
+    stream = client.chat.completions.create(model=model, messages=messages, stream=True)
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
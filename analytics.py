@@ -0,0 +1,184 @@
+# ============================
+# 历史表现与风险分析（NumPy 向量化）
+# 基于本地净值库构建 日期 × 基金 的净值矩阵，按当前份额回溯组合市值、收益、回撤、波动与相关性
+# 矩阵常驻内存，新交易日只追加一行
+# ============================
+import threading
+import time
+from datetime import date, timedelta
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+TRADING_DAYS = 252
+
+# 追加新交易日前最少间隔（秒），避免每次重跑都去检查净值更新
+SYNC_INTERVAL = 600
+
+
+def _fill_gaps(navs: np.ndarray) -> np.ndarray:
+    """按列前向填充缺失净值（停牌 / 节假日差异），开头的缺失用首个有效值回填"""
+    rows = np.arange(navs.shape[0])[:, None]
+    cols = np.arange(navs.shape[1])[None, :]
+    valid = ~np.isnan(navs)
+    last = np.maximum.accumulate(np.where(valid, rows, 0), axis=0)
+    filled = navs[last, cols]
+    first = np.argmax(valid, axis=0)
+    lead = (rows < first) & valid.any(axis=0)
+    return np.where(lead, navs[first, np.arange(navs.shape[1])][None, :], filled)
+
+
+class PortfolioAnalytics:
+    """
+    对齐后的净值矩阵及其派生指标。
+
+    组合市值 = 净值矩阵 @ 当前份额；份额不变时，追加一天只需一次点积和一次滚动最大值更新。
+    构建时回补失败的基金记在 incomplete 中，sync 时重试，补齐后按净值库重建矩阵。
+    """
+
+    def __init__(self, codes: Iterable[str], dates: np.ndarray, navs: np.ndarray,
+                 start: Optional[date] = None, incomplete: Iterable[str] = ()):
+        self.codes = [str(c).zfill(6) for c in codes]
+        self._start = start
+        self.incomplete = {str(c).zfill(6) for c in incomplete}
+        n = len(dates)
+        cap = max(64, n * 2)
+        self._dates = np.empty(cap, dtype="datetime64[D]")
+        self._dates[:n] = dates
+        self._navs = np.full((cap, len(self.codes)), np.nan)
+        self._navs[:n] = navs
+        self._n = n
+        self._shares: Optional[np.ndarray] = None
+        self._values = np.empty(cap)
+        self._peak = np.empty(cap)
+        self._lock = threading.Lock()
+        self._synced_at = time.time()
+
+    @classmethod
+    def from_store(cls, store, codes: Iterable[str], start, end,
+                   incomplete: Iterable[str] = ()) -> "PortfolioAnalytics":
+        """从净值库读取 [start, end] 构建矩阵；incomplete 为本次回补失败、有待重试的基金"""
+        codes = [str(c).zfill(6) for c in codes]
+        series = [store.get_range(c, start, end) for c in codes]
+        all_dates = sorted({d for rows in series for d, _ in rows})
+        index = {d: i for i, d in enumerate(all_dates)}
+        navs = np.full((len(all_dates), len(codes)), np.nan)
+        for j, rows in enumerate(series):
+            if rows:
+                navs[[index[d] for d, _ in rows], j] = [v for _, v in rows]
+        if len(all_dates):
+            navs = _fill_gaps(navs)
+        return cls(codes, np.array(all_dates, dtype="datetime64[D]"), navs, start, incomplete)
+
+    # ---------- 增量更新 ----------
+    @property
+    def last_date(self) -> Optional[date]:
+        return self._dates[self._n - 1].astype(date) if self._n else None
+
+    def _grow(self):
+        cap = self._dates.shape[0] * 2
+        for name in ("_dates", "_values", "_peak"):
+            old = getattr(self, name)
+            new = np.empty(cap, dtype=old.dtype)
+            new[:self._n] = old[:self._n]
+            setattr(self, name, new)
+        navs = np.full((cap, len(self.codes)), np.nan)
+        navs[:self._n] = self._navs[:self._n]
+        self._navs = navs
+
+    def append_day(self, day, navs_by_code: Dict[str, float]):
+        """追加一个比现有数据更新的交易日；缺失的基金沿用前一日净值"""
+        day = np.datetime64(day, "D")
+        with self._lock:
+            if self._n and day <= self._dates[self._n - 1]:
+                return
+            if self._n == self._dates.shape[0]:
+                self._grow()
+            row = np.array([navs_by_code.get(c, np.nan) for c in self.codes], dtype=float)
+            if self._n:
+                row = np.where(np.isnan(row), self._navs[self._n - 1], row)
+            i = self._n
+            self._dates[i] = day
+            self._navs[i] = row
+            if self._shares is not None:
+                self._values[i] = np.nansum(row * self._shares)
+                self._peak[i] = max(self._peak[i - 1], self._values[i]) if i else self._values[i]
+            self._n += 1
+
+    def _reload(self, store, end):
+        """重试回补失败的基金并按净值库重建整个矩阵（份额对应的市值在下次 metrics 时重算）"""
+        results = store.backfill_many(self.incomplete, self._start, end)
+        fresh = PortfolioAnalytics.from_store(store, self.codes, self._start, end,
+                                              incomplete=[c for c, n in results.items() if n < 0])
+        with self._lock:
+            self._dates, self._navs, self._n = fresh._dates, fresh._navs, fresh._n
+            self._values, self._peak = fresh._values, fresh._peak
+            self._shares = None
+            self.incomplete = fresh.incomplete
+
+    def sync(self, store, min_interval: float = SYNC_INTERVAL) -> int:
+        """从净值库补齐最新交易日并追加到矩阵，返回新增天数（间隔过短时跳过）"""
+        if time.time() - self._synced_at < min_interval:
+            return 0
+        self._synced_at = time.time()
+        today = date.today()
+        if self.incomplete and self._start is not None:
+            n = self._n
+            self._reload(store, today)
+            return self._n - n
+        if not self._n:
+            return 0
+        start = self.last_date + timedelta(days=1)
+        if start > today:
+            return 0
+        store.backfill_many(self.codes, start, today)
+        by_day: Dict[str, Dict[str, float]] = {}
+        for code in self.codes:
+            for d, nav in store.get_range(code, start, today):
+                by_day.setdefault(d, {})[code] = nav
+        for d in sorted(by_day):
+            self.append_day(d, by_day[d])
+        return len(by_day)
+
+    # ---------- 指标 ----------
+    def metrics(self, shares: Dict[str, float], window: int = 20) -> dict:
+        """
+        按给定份额计算：组合市值、日收益、回撤、最大回撤、滚动年化波动、区间收益与基金间相关系数。
+        """
+        vec = np.array([float(shares.get(c, 0.0)) for c in self.codes])
+        with self._lock:
+            n = self._n
+            if self._shares is None or not np.array_equal(vec, self._shares):
+                self._shares = vec
+                self._values[:n] = np.nansum(self._navs[:n] * vec, axis=1)
+                self._peak[:n] = np.maximum.accumulate(self._values[:n]) if n else self._peak[:n]
+            dates = pd.DatetimeIndex(self._dates[:n])
+            values = self._values[:n].copy()
+            peak = self._peak[:n].copy()
+            navs = self._navs[:n].copy()
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns = values[1:] / values[:-1] - 1
+            drawdown = np.where(peak > 0, values / peak - 1, 0.0)
+            fund_returns = navs[1:] / navs[:-1] - 1
+            corr = np.corrcoef(fund_returns, rowvar=False) if len(fund_returns) > 1 else np.full((len(self.codes),) * 2, np.nan)
+        returns = np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+        if len(returns) >= window:
+            rolling = sliding_window_view(returns, window).std(axis=1, ddof=1) * np.sqrt(TRADING_DAYS)
+            rolling_vol = pd.Series(rolling, index=dates[window:])
+        else:
+            rolling_vol = pd.Series(dtype=float)
+
+        return {
+            "value": pd.Series(values, index=dates),
+            "returns": pd.Series(returns, index=dates[1:]),
+            "drawdown": pd.Series(drawdown, index=dates),
+            "rolling_vol": rolling_vol,
+            "max_drawdown": float(drawdown.min()) if n else 0.0,
+            "volatility": float(returns.std(ddof=1) * np.sqrt(TRADING_DAYS)) if len(returns) > 1 else 0.0,
+            "total_return": float(values[-1] / values[0] - 1) if n and values[0] > 0 else 0.0,
+            "correlation": pd.DataFrame(np.atleast_2d(corr), index=self.codes, columns=self.codes),
+        }
@@ -0,0 +1,191 @@
+# ============================
+# 离线基准测试：在本地替身服务上跑页面的各条数据路径
+#
+#   python -m bench.run_bench --sizes 1 10 50 100 500 --latency 0.02 --error-rate 0.05
+#
+# 输出每条路径在各持仓规模下的 p50 / p95 延迟（毫秒）与每次操作的外部请求数
+# ============================
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from bench.stubs import ROUTES, StubConfig, StubServices
+
+BENCH_USER = "bench"
+# 汇总视图的账户（第一个即 BENCH_USER）
+BENCH_HOUSEHOLD = [BENCH_USER, "bench-2", "bench-3"]
+# 满足 supabase-py 对 key 格式（JWT 三段式）的校验即可
+BENCH_SUPABASE_KEY = "bench.stub.key"
+
+
+def point_env_at(url: str):
+    """让各模块的外部服务地址指向替身（必须在导入业务模块之前调用）"""
+    os.environ["FUNDGZ_BASE"] = url
+    os.environ["EASTMONEY_BASE"] = url
+    os.environ["DEEPSEEK_BASE_URL"] = url
+    os.environ["SUPABASE_URL"] = url
+    os.environ["SUPABASE_KEY"] = BENCH_SUPABASE_KEY
+
+
+def measure(stubs: StubServices, op: Callable, repeat: int, setup: Callable = None) -> Dict:
+    """重复执行 op，返回延迟分位数与平均每次的请求数（setup 不计时、不计请求）"""
+    samples = []
+    requests_made = 0
+    errors = 0
+    for _ in range(repeat):
+        if setup:
+            setup()
+        before = stubs.counts()
+        start = time.perf_counter()
+        try:
+            op()
+        except Exception:
+            errors += 1
+        samples.append((time.perf_counter() - start) * 1000)
+        after = stubs.counts()
+        requests_made += sum(after[r] - before[r] for r in ROUTES)
+    return {
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "requests": requests_made / repeat,
+        "errors": errors,
+    }
+
+
+def run(sizes: List[int], repeat: int, stubs: StubServices) -> List[Dict]:
+    # 业务模块在地址指向替身之后才导入
+    from supabase import create_client
+
+    from ai_chat import build_messages, build_system_prompt, make_client, stream_reply
+    from market_data import fetch_quotes
+    from nav_store import NavStore
+    from portfolio_store import (
+        apply_portfolio_changes, fetch_portfolio, fetch_portfolio_version, fetch_portfolios, fetch_portfolio_versions
+    )
+    from valuation import quotes_to_frame, value_portfolio
+
+    client = create_client(stubs.url, BENCH_SUPABASE_KEY)
+    ai_client = make_client("sk-bench")
+    results = []
+
+    def record(path: str, size, stats: Dict):
+        results.append(dict(path=path, size=size, **stats))
+
+    # 历史净值与持仓规模无关：冷库（需回补）与热库（纯本地）各测一次
+    tmp_dir = tempfile.mkdtemp(prefix="lumila-bench-")
+    trade_day = date.today() - timedelta(days=30)
+    store = {}
+
+    def fresh_store():
+        store["s"] = NavStore(os.path.join(tmp_dir, f"nav-{time.perf_counter_ns()}.sqlite3"))
+
+    record("get_history_nav(cold)", "-",
+           measure(stubs, lambda: store["s"].lookup("000001", trade_day), repeat, setup=fresh_store))
+    record("get_history_nav(warm)", "-",
+           measure(stubs, lambda: store["s"].lookup("000001", trade_day), repeat))
+
+    for size in sizes:
+        for user in BENCH_HOUSEHOLD:
+            stubs.state.seed_portfolio(user, size)
+        record("load_portfolio", size, measure(stubs, lambda: fetch_portfolio(client, BENCH_USER), repeat))
+        # 会话缓存命中时每次重跑只做这一次版本号查询
+        record("portfolio_version", size, measure(
+            stubs, lambda: fetch_portfolio_version(client, BENCH_USER), repeat))
+        # 全家汇总：全部账户的持仓与版本号各一次查询
+        record("load_household", size, measure(stubs, lambda: fetch_portfolios(client, BENCH_HOUSEHOLD), repeat))
+        record("household_versions", size, measure(
+            stubs, lambda: fetch_portfolio_versions(client, BENCH_HOUSEHOLD), repeat))
+
+        # 每次改动一行：基线在 setup 中重新读取，只计 diff + RPC 的耗时
+        frames = {}
+
+        def load_base():
+            frames["base"] = fetch_portfolio(client, BENCH_USER)
+            frames["new"] = frames["base"].copy()
+            frames["new"].loc[0, "持有份额"] += 1
+
+        record("save_portfolio", size, measure(
+            stubs, lambda: apply_portfolio_changes(client, BENCH_USER, frames["base"], frames["new"]),
+            repeat, setup=load_base))
+
+        holdings = fetch_portfolio(client, BENCH_USER)
+        codes = holdings["基金代码"].tolist()
+        quote_results = {}
+        record("fetch_fund_data(batch)", size, measure(
+            stubs, lambda: quote_results.update(fetch_quotes(codes)), repeat))
+
+        quotes_df = quotes_to_frame({c: r.quote for c, r in quote_results.items()})
+        valued = {}
+        record("valuation", size, measure(
+            stubs, lambda: valued.update(zip(("funds", "totals"), value_portfolio(holdings, quotes_df))), repeat))
+
+        view_data = valued["funds"].round(2).to_dict("records")
+        history = [{"role": "user", "content": "帮我分析一下持仓"}]
+        messages = build_messages(build_system_prompt(BENCH_USER, view_data, valued["totals"]), history)
+        first = []
+
+        def ask():
+            start = time.perf_counter()
+            for i, _ in enumerate(stream_reply(ai_client, messages)):
+                if i == 0:
+                    first.append((time.perf_counter() - start) * 1000)
+
+        stats = measure(stubs, ask, repeat)
+        if first:
+            stats["ttft_p50_ms"] = float(np.percentile(first, 50))
+        record("ai_request", size, stats)
+
+    return results
+
+
+def print_table(results: List[Dict]):
+    print(f"{'path':<24}{'size':>6}{'p50 ms':>11}{'p95 ms':>11}{'req/op':>9}{'errors':>8}")
+    for r in results:
+        line = f"{r['path']:<24}{str(r['size']):>6}{r['p50_ms']:>11.2f}{r['p95_ms']:>11.2f}{r['requests']:>9.1f}{r['errors']:>8}"
+        if "ttft_p50_ms" in r:
+            line += f"   ttft p50 {r['ttft_p50_ms']:.2f} ms"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="噜咪啦数据路径离线基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 50, 100, 500])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.02, help="每个外部请求的固定延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="额外随机延迟上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="外部请求返回 503 的概率")
+    parser.add_argument("--route-latency", action="append", default=[], metavar="ROUTE=SECONDS",
+                        help=f"按路由覆盖延迟，路由: {', '.join(ROUTES)}")
+    parser.add_argument("--json", metavar="PATH", help="额外把结果写成 JSON lines")
+    args = parser.parse_args(argv)
+
+    overrides = {}
+    for item in args.route_latency:
+        route, _, seconds = item.partition("=")
+        overrides.setdefault(route, {})["latency"] = float(seconds)
+    config = StubConfig(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, overrides=overrides)
+
+    stubs = StubServices(config).start()
+    point_env_at(stubs.url)
+    try:
+        results = run(args.sizes, args.repeat, stubs)
+    finally:
+        stubs.stop()
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            for r in results:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
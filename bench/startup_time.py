@@ -0,0 +1,111 @@
+# ============================
+# 冷启动耗时测量
+#
+#   python -m bench.startup_time --repeat 5
+#
+# 1. 在全新解释器中分别计时各依赖与业务模块的导入（取中位数）
+# 2. 计时创建一次 Supabase / DeepSeek 客户端（缓存之前每次页面重跑都要付出这部分）
+# 3. 安装了 streamlit 时，用 AppTest 在本地替身服务上跑 lumila.py：首次运行与再次重跑各计时一次
+# ============================
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from bench.run_bench import BENCH_SUPABASE_KEY, point_env_at
+from bench.stubs import StubConfig, StubServices
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 页面启动时必然导入的模块（与 lumila.py 顶部一致）
+PAGE_MODULES = [
+    "pandas", "quote_cache", "tick_buffer", "portfolio_io", "portfolio_store", "ledger", "valuation", "nav_store",
+    "snapshots", "analytics", "fund_index", "market_data", "ai_chat", "tracing",
+]
+# 延迟到首次使用才导入的重型依赖
+LAZY_MODULES = ["supabase", "openai"]
+
+
+def import_time(modules: List[str], repeat: int) -> float:
+    """在全新解释器中导入 modules，返回耗时中位数（毫秒，不含解释器自身启动）"""
+    code = (
+        "import time; t = time.perf_counter()\n"
+        + "".join(f"import {m}\n" for m in modules)
+        + "print((time.perf_counter() - t) * 1000)"
+    )
+    samples = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+        if out.returncode != 0:
+            return float("nan")
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+def client_time(url: str, repeat: int) -> Dict[str, float]:
+    """创建客户端的耗时中位数（毫秒，模块已导入）"""
+    from supabase import create_client
+
+    from ai_chat import make_client
+
+    results = {}
+    for name, factory in (
+        ("create_client(supabase)", lambda: create_client(url, BENCH_SUPABASE_KEY)),
+        ("make_client(deepseek)", lambda: make_client("sk-bench")),
+    ):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            factory()
+            samples.append((time.perf_counter() - start) * 1000)
+        results[name] = statistics.median(samples)
+    return results
+
+
+def page_time(repeat: int) -> Dict[str, float]:
+    """用 streamlit AppTest 运行页面：首次运行含全部导入与资源创建，之后的重跑只走缓存"""
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        return {}
+    at = AppTest.from_file(os.path.join(ROOT, "lumila.py"), default_timeout=60)
+    start = time.perf_counter()
+    at.run()
+    results = {"page first run": (time.perf_counter() - start) * 1000}
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        at.run()
+        samples.append((time.perf_counter() - start) * 1000)
+    results["page rerun"] = statistics.median(samples)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="噜咪啦冷启动耗时测量")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rows = [("import " + m, import_time([m], args.repeat)) for m in PAGE_MODULES + LAZY_MODULES]
+    rows.append(("import page modules", import_time(PAGE_MODULES, args.repeat)))
+    rows.append(("import page + lazy modules", import_time(PAGE_MODULES + LAZY_MODULES, args.repeat)))
+
+    stubs = StubServices(StubConfig(latency=0.0)).start()
+    point_env_at(stubs.url)
+    try:
+        rows += list(client_time(stubs.url, args.repeat).items())
+        rows += list(page_time(args.repeat).items())
+    finally:
+        stubs.stop()
+
+    print(f"{'step':<32}{'median ms':>12}")
+    for name, ms in rows:
+        print(f"{name:<32}{ms:>12.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
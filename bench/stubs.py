@@ -0,0 +1,336 @@
+# ============================
+# 本地外部服务替身（基准测试用）
+# 一个 HTTP 服务同时模拟 fundgz / 东方财富 lsjz / Supabase PostgREST / DeepSeek
+# 支持全局或按路由设置延迟、抖动和错误注入，并统计每条路由的请求次数
+# ============================
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+ROUTES = ["fundgz", "lsjz", "supabase", "deepseek"]
+
+
+@dataclass
+class StubConfig:
+    latency: float = 0.0          # 每个请求的固定延迟（秒）
+    jitter: float = 0.0           # 额外均匀随机延迟上限（秒）
+    error_rate: float = 0.0       # 返回 503 的概率
+    overrides: Dict[str, dict] = field(default_factory=dict)   # 路由 -> {latency/jitter/error_rate}
+    reply_chunks: int = 20        # DeepSeek 流式回答的分片数
+    token_latency: float = 0.0    # DeepSeek 每个分片之间的间隔（秒）
+
+    def for_route(self, route: str) -> dict:
+        conf = {"latency": self.latency, "jitter": self.jitter, "error_rate": self.error_rate}
+        conf.update(self.overrides.get(route, {}))
+        return conf
+
+
+def _nav_for(code: str, day: date) -> float:
+    """确定性的伪净值：同一基金同一天总是相同"""
+    seed = zlib.crc32(code.encode())
+    return round(1.0 + (seed % 1000) / 1000 + ((day.toordinal() * 7 + seed) % 200) / 1000, 4)
+
+
+class StubState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.portfolios: Dict[str, Dict[str, dict]] = {}
+        self.transactions = []
+        self.heads = Counter()    # username -> 持仓版本号（对应 portfolio_heads 表）
+        self.closed_realized = Counter()    # username -> 已移除持仓行的已实现收益
+        self.snapshots: Dict[tuple, dict] = {}    # (username, snap_date, slot) -> 快照行
+        self.counts = Counter()
+
+    def seed_portfolio(self, username: str, size: int):
+        with self.lock:
+            self.portfolios[username] = {
+                f"{i + 1:06d}": {
+                    "username": username, "fund_code": f"{i + 1:06d}", "fund_name": f"基金{i + 1:06d}",
+                    "shares": 1000.0 + i, "cost_price": 1.2, "version": 1,
+                    "realized_pnl": 0.0, "ledger_seq": 0,
+                }
+                for i in range(size)
+            }
+            self.heads[username] += 1
+
+
+class _Conflict(Exception):
+    pass
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "LumilaStub/1.0"
+    # 响应头与响应体分两次写出，关闭 Nagle 以免叠加 40ms 的延迟确认
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    # ---------- 公共 ----------
+    @property
+    def state(self) -> StubState:
+        return self.server.state
+
+    def _route(self, path: str) -> Optional[str]:
+        if path.startswith("/js/"):
+            return "fundgz"
+        if path.startswith("/f10/lsjz"):
+            return "lsjz"
+        if path.startswith("/rest/v1/"):
+            return "supabase"
+        if path.endswith("/chat/completions"):
+            return "deepseek"
+        return None
+
+    def _send(self, status: int, body, content_type: str = "application/json"):
+        data = body if isinstance(body, bytes) else (
+            body.encode() if isinstance(body, str) else json.dumps(body, ensure_ascii=False).encode())
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _enter(self, route: str) -> bool:
+        """计数、延迟、错误注入；返回 False 表示已按错误响应"""
+        conf = self.server.config.for_route(route)
+        with self.state.lock:
+            self.state.counts[route] += 1
+        delay = conf["latency"] + random.uniform(0, conf["jitter"])
+        if delay > 0:
+            time.sleep(delay)
+        if conf["error_rate"] and random.random() < conf["error_rate"]:
+            self._send(503, {"message": "injected failure"})
+            return False
+        return True
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self._body()  # postgrest-py 的 GET 也会带 "{}" 请求体，需读掉以保持长连接可用
+        route = self._route(url.path)
+        if route is None:
+            return self._send(404, {"message": "not found"})
+        if not self._enter(route):
+            return
+        if route == "fundgz":
+            return self._fundgz(url.path)
+        if route == "lsjz":
+            return self._lsjz(parse_qs(url.query))
+        return self._select(url.path, url.query)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        route = self._route(url.path)
+        if route is None:
+            return self._send(404, {"message": "not found"})
+        body = self._body()
+        if not self._enter(route):
+            return
+        if route == "deepseek":
+            return self._chat(body)
+        name = url.path.rsplit("/", 1)[-1]
+        if name == "snapshots":
+            with self.state.lock:
+                for row in body if isinstance(body, list) else [body]:
+                    self.state.snapshots[(row["username"], row["snap_date"], row["slot"])] = dict(row)
+            return self._send(201, [])
+        try:
+            with self.state.lock:
+                if name == "apply_portfolio_changes":
+                    return self._send(200, [{"changed_rows": self._apply_changes(body)}])
+                if name == "record_trade":
+                    return self._send(200, [{"trade_id": self._record_trade(body)}])
+        except _Conflict as e:
+            return self._send(400, {"message": f"portfolio_conflict: {e}", "code": "P0001"})
+        return self._send(404, {"message": f"unknown rpc {name}"})
+
+    # ---------- fundgz ----------
+    def _fundgz(self, path: str):
+        code = path.rsplit("/", 1)[-1].split(".")[0]
+        today = date.today()
+        dwjz = _nav_for(code, today - timedelta(days=1))
+        gsz = _nav_for(code, today)
+        payload = {
+            "fundcode": code, "name": f"基金{code}", "jzrq": (today - timedelta(days=1)).isoformat(),
+            "dwjz": f"{dwjz:.4f}", "gsz": f"{gsz:.4f}", "gszzl": f"{(gsz / dwjz - 1) * 100:.2f}",
+            "gztime": f"{today.isoformat()} 14:30",
+        }
+        self._send(200, f"jsonpgz({json.dumps(payload, ensure_ascii=False)});", "application/javascript")
+
+    # ---------- lsjz ----------
+    def _lsjz(self, q: dict):
+        code = q["fundCode"][0]
+        start = date.fromisoformat(q["startDate"][0])
+        end = date.fromisoformat(q["endDate"][0])
+        page, size = int(q.get("pageIndex", ["1"])[0]), int(q.get("pageSize", ["20"])[0])
+        days = []
+        d = end
+        while d >= start:
+            if d.weekday() < 5:
+                days.append(d)
+            d -= timedelta(days=1)
+        items = [{"FSRQ": d.isoformat(), "DWJZ": f"{_nav_for(code, d):.4f}"}
+                 for d in days[(page - 1) * size:page * size]]
+        self._send(200, {"Data": {"LSJZList": items}, "ErrCode": 0, "TotalCount": len(days)})
+
+    # ---------- Supabase PostgREST ----------
+    def _select(self, path: str, query: str):
+        table = path[len("/rest/v1/"):]
+        if table not in ("portfolios", "portfolio_heads", "transactions", "snapshots", "latest_snapshots"):
+            return self._send(200, [])
+        filters = []
+        columns, order = None, None
+        for key, values in parse_qs(query).items():
+            value = unquote(values[0])
+            if key == "select":
+                columns = None if value == "*" else value.split(",")
+                continue
+            if key == "order":
+                column, _, direction = value.partition(".")
+                order = (column, direction == "desc")
+                continue
+            op, _, arg = value.partition(".")
+            if op == "eq":
+                filters.append((key, lambda v, arg=arg: v == arg))
+            elif op == "in":
+                allowed = {v.strip('"') for v in arg.strip("()").split(",")}
+                filters.append((key, lambda v, allowed=allowed: v in allowed))
+            elif op == "gte":
+                filters.append((key, lambda v, arg=arg: v >= arg))
+            elif op == "gt":
+                filters.append((key, lambda v, arg=arg: float(v) > float(arg)))
+        with self.state.lock:
+            if table == "portfolio_heads":
+                rows = [{"username": u, "version": v, "closed_realized": self.state.closed_realized[u]}
+                        for u, v in self.state.heads.items()]
+            elif table == "portfolios":
+                rows = [dict(r) for user_rows in self.state.portfolios.values() for r in user_rows.values()]
+            elif table == "transactions":
+                rows = [dict(r) for r in self.state.transactions]
+            else:
+                rows = [dict(r) for r in self.state.snapshots.values()]
+        if table == "latest_snapshots":
+            latest = {}
+            for r in sorted(rows, key=lambda r: r["taken_at"]):
+                latest[r["username"]] = r
+            rows = list(latest.values())
+        rows = [r for r in rows if all(match(str(r.get(k))) for k, match in filters)]
+        if order:
+            rows.sort(key=lambda r: r[order[0]], reverse=order[1])
+        if columns:
+            rows = [{c: r.get(c) for c in columns} for r in rows]
+        self._send(200, rows)
+
+    def _apply_changes(self, body: dict) -> int:
+        rows = self.state.portfolios.setdefault(body["p_username"], {})
+        staged = {code: dict(r) for code, r in rows.items()}
+        closed = 0.0
+        for d in body.get("p_deletes") or []:
+            cur = staged.get(d["fund_code"])
+            if cur is None or (d.get("version") is not None and cur["version"] != d["version"]):
+                raise _Conflict(d["fund_code"])
+            closed += staged.pop(d["fund_code"])["realized_pnl"]
+        for u in body.get("p_upserts") or []:
+            cur = staged.get(u["fund_code"])
+            if u.get("version") is None:
+                if cur is not None:
+                    raise _Conflict(u["fund_code"])
+                staged[u["fund_code"]] = {
+                    "username": body["p_username"], "fund_code": u["fund_code"], "fund_name": u["fund_name"],
+                    "shares": u["shares"], "cost_price": u["cost_price"], "version": 1,
+                    "realized_pnl": 0.0, "ledger_seq": max(
+                        (t["id"] for t in self.state.transactions
+                         if t["username"] == body["p_username"] and t["fund_code"] == u["fund_code"]), default=0),
+                }
+            else:
+                if cur is None or cur["version"] != u["version"]:
+                    raise _Conflict(u["fund_code"])
+                cur.update(fund_name=u["fund_name"], shares=u["shares"], cost_price=u["cost_price"],
+                           version=cur["version"] + 1)
+        rows.clear()
+        rows.update(staged)
+        self.state.heads[body["p_username"]] += 1
+        self.state.closed_realized[body["p_username"]] += closed
+        return len(body.get("p_deletes") or []) + len(body.get("p_upserts") or [])
+
+    def _record_trade(self, body: dict) -> int:
+        trade, pos = body["p_trade"], body["p_position"]
+        cur = self.state.portfolios.get(body["p_username"], {}).get(trade["fund_code"])
+        if cur is None or cur["version"] != pos["version"]:
+            raise _Conflict(trade["fund_code"])
+        trade_id = len(self.state.transactions) + 1
+        self.state.transactions.append(dict(trade, id=trade_id, username=body["p_username"]))
+        cur.update(shares=pos["shares"], cost_price=pos["cost_price"], realized_pnl=pos["realized_pnl"],
+                   ledger_seq=trade_id, version=cur["version"] + 1)
+        self.state.heads[body["p_username"]] += 1
+        return trade_id
+
+    # ---------- DeepSeek ----------
+    def _chat(self, body: dict):
+        conf = self.server.config
+        pieces = [f"第{i + 1}段分析。" for i in range(conf.reply_chunks)]
+        base = {"id": "stub", "created": int(time.time()), "model": body.get("model", "deepseek-chat")}
+        if not body.get("stream"):
+            return self._send(200, dict(base, object="chat.completion", choices=[{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "".join(pieces)},
+            }], usage={"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for i, piece in enumerate(pieces):
+            if i and conf.token_latency:
+                time.sleep(conf.token_latency)
+            chunk = dict(base, object="chat.completion.chunk", choices=[{
+                "index": 0, "delta": {"content": piece}, "finish_reason": None,
+            }])
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class StubServices:
+    """在后台线程启动替身服务；url 可同时作为四个服务的 base URL"""
+
+    def __init__(self, config: Optional[StubConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or StubConfig()
+        self.state = StubState()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.config = self.config
+        self._server.state = self.state
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServices":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def counts(self) -> Counter:
+        with self.state.lock:
+            return Counter(self.state.counts)
@@ -0,0 +1,137 @@
+# ============================
+# 基金目录索引（全市场基金：代码 / 拼音首字母 / 名称 / 类型）
+# 进程内加载一次，排好序的 NumPy 数组做前缀查找，拼接文本做子串 / 首字母模糊匹配
+# ============================
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+# 前缀查找的上界哨兵（大于任何常用字符）
+_MAX_CHAR = "\U0010ffff"
+
+
+class FundIndex:
+    """
+    只读的基金目录索引。
+
+    - codes / abbrs / names 三组有序数组：searchsorted 即可得到前缀区间
+    - 代码+首字母（纯 ASCII）与名称各拼成一段文本做子串匹配，行偏移数组把命中位置映射回基金
+    - 首字母另存为定宽字节矩阵，按序模糊匹配时逐字符收窄候选行
+    """
+
+    def __init__(self, rows: Iterable[Sequence[str]]):
+        rows = sorted({str(r[0]).zfill(6): r for r in rows}.values(), key=lambda r: str(r[0]).zfill(6))
+        self.codes = np.array([str(r[0]).zfill(6) for r in rows], dtype="U6")
+        abbrs = np.array([str(r[1]).upper() for r in rows])
+        names = np.array([str(r[2]) for r in rows])
+        self.types = np.array([str(r[3]) if len(r) > 3 else "" for r in rows])
+        self.abbrs = abbrs
+        self.names = names
+
+        self._abbr_order = np.argsort(abbrs, kind="stable")
+        self._abbr_sorted = abbrs[self._abbr_order]
+        self._name_order = np.argsort(names, kind="stable")
+        self._name_sorted = names[self._name_order]
+
+        key_lines = [f"{c}\t{a}" for c, a in zip(self.codes, abbrs)]
+        name_lines = [n.upper() for n in names]
+        self._texts = [
+            ("\n".join(key_lines), self._line_offsets(key_lines)),
+            ("\n".join(name_lines), self._line_offsets(name_lines)),
+        ]
+        width = max((len(a) for a in abbrs), default=1)
+        self._abbr_bytes = np.zeros((len(abbrs), width), dtype=np.uint8)
+        for i, a in enumerate(abbrs):
+            raw = a.encode("ascii", "ignore")
+            self._abbr_bytes[i, :len(raw)] = np.frombuffer(raw, dtype=np.uint8)
+        # 每行出现过哪些字母（A-Z 各占一位），模糊匹配前先按位过滤
+        letters = self._abbr_bytes.astype(np.int64) - ord("A")
+        bits = np.where((letters >= 0) & (letters < 26), np.left_shift(1, letters.clip(0, 25)), 0)
+        self._abbr_letters = np.bitwise_or.reduce(bits, axis=1) if len(abbrs) else np.zeros(0, dtype=np.int64)
+
+    @staticmethod
+    def _line_offsets(lines: List[str]) -> np.ndarray:
+        """每行在 "\n" 拼接文本中的起始位置"""
+        lengths = np.fromiter((len(line) + 1 for line in lines), dtype=np.int64, count=len(lines))
+        return np.concatenate(([0], np.cumsum(lengths)))[:-1]
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def _row(self, i: int) -> dict:
+        return {"code": self.codes[i], "name": self.names[i], "abbr": self.abbrs[i], "type": self.types[i]}
+
+    def get(self, code) -> Optional[dict]:
+        """按 6 位代码精确查找"""
+        code = str(code).zfill(6)
+        i = int(np.searchsorted(self.codes, code))
+        if i < len(self.codes) and self.codes[i] == code:
+            return self._row(i)
+        return None
+
+    @staticmethod
+    def _prefix(sorted_arr: np.ndarray, prefix: str) -> slice:
+        lo = np.searchsorted(sorted_arr, prefix, side="left")
+        hi = np.searchsorted(sorted_arr, prefix + _MAX_CHAR, side="left")
+        return slice(int(lo), int(hi))
+
+    def search(self, query: str, limit: int = 20) -> List[dict]:
+        """
+        按相关度依次返回：代码前缀、首字母前缀、名称前缀、任意位置子串、首字母按序模糊（如 hxcz → HXCZHH）。
+        """
+        q = query.strip()
+        if not q or not len(self.codes):
+            return []
+        qu = q.upper()
+        hits: List[int] = []
+        seen = set()
+
+        def add(indices):
+            for i in indices:
+                i = int(i)
+                if i not in seen:
+                    seen.add(i)
+                    hits.append(i)
+                    if len(hits) >= limit:
+                        return True
+            return False
+
+        digits = q.isdigit()
+        if digits and add(range(*self._prefix(self.codes, q).indices(len(self.codes)))):
+            return [self._row(i) for i in hits]
+        if not digits and add(self._abbr_order[self._prefix(self._abbr_sorted, qu)]):
+            return [self._row(i) for i in hits]
+        if not digits and add(self._name_order[self._prefix(self._name_sorted, q)]):
+            return [self._row(i) for i in hits]
+
+        # 子串匹配：在整段文本中逐个查找，命中位置二分映射回行号，再从下一行继续
+        for text, offsets in self._texts:
+            pos = text.find(qu)
+            while pos != -1:
+                row = int(np.searchsorted(offsets, pos, side="right")) - 1
+                if add([row]):
+                    return [self._row(i) for i in hits]
+                pos = text.find(qu, int(offsets[row + 1])) if row + 1 < len(offsets) else -1
+
+        # 拼音首字母按序模糊匹配
+        if len(qu) > 1 and qu.isascii() and qu.isalpha():
+            add(self._subsequence(qu))
+        return [self._row(i) for i in hits]
+
+    def _subsequence(self, qu: str) -> np.ndarray:
+        """首字母中按顺序包含 qu 各字母的基金行号（候选行随每个字母收窄）"""
+        need = 0
+        for ch in qu.encode("ascii"):
+            if ord("A") <= ch <= ord("Z"):
+                need |= 1 << (ch - ord("A"))
+        rows = np.flatnonzero((self._abbr_letters & need) == need)
+        pos = np.full(len(rows), -1)
+        cols = np.arange(self._abbr_bytes.shape[1])
+        for ch in qu.encode("ascii"):
+            match = (self._abbr_bytes[rows] == ch) & (cols > pos[:, None])
+            found = match.any(axis=1)
+            rows = rows[found]
+            pos = match[found].argmax(axis=1)
+            if not len(rows):
+                break
+        return rows
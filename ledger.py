@@ -0,0 +1,147 @@
+# ============================
+# 交易流水账本（Supabase transactions 表）
+# 每笔买入/卖出追加一行；portfolios 中的持仓行是账本的物化聚合（检查点）
+# ============================
+from typing import Dict, Iterable, List, NamedTuple
+
+from portfolio_store import PortfolioConflict
+
+# 剩余份额低于该值视为已清仓
+DUST_SHARES = 0.01
+
+SIDE_LABELS = {"买入": "buy", "卖出": "sell"}
+
+
+class Position(NamedTuple):
+    """单只基金的聚合持仓；seq 为已计入的最后一笔流水 id（检查点）"""
+    shares: float
+    cost_price: float
+    realized_pnl: float = 0.0
+    seq: int = 0
+
+
+class InsufficientShares(ValueError):
+    """卖出份额超过持有份额"""
+
+    def __init__(self, requested: float, available: float):
+        super().__init__(f"需卖出 {requested:.2f}，但只有 {available:.2f}")
+        self.requested = requested
+        self.available = available
+
+
+def apply_trade(position: Position, side: str, amount: float, nav: float, seq: int = None) -> Position:
+    """
+    把一笔交易计入聚合持仓（O(1)）。
+
+    买入按金额摊薄成本；卖出按当前成本价结转已实现收益，成本价不变。
+    """
+    shares = amount / nav
+    if side == "buy":
+        total = position.shares + shares
+        cost = (position.shares * position.cost_price + amount) / total
+        new = position._replace(shares=total, cost_price=cost)
+    elif side == "sell":
+        if shares > position.shares + DUST_SHARES:
+            raise InsufficientShares(shares, position.shares)
+        sold = min(shares, position.shares)
+        remain = position.shares - sold
+        new = position._replace(
+            shares=remain if remain >= DUST_SHARES else 0.0,
+            realized_pnl=position.realized_pnl + sold * (nav - position.cost_price),
+        )
+    else:
+        raise ValueError(f"未知的交易方向: {side}")
+    return new if seq is None else new._replace(seq=seq)
+
+
+def replay(checkpoint: Position, trades: Iterable[dict]) -> Position:
+    """从检查点开始重放账本，只计入 id 大于检查点的流水"""
+    position = checkpoint
+    for trade in sorted(trades, key=lambda t: t["id"]):
+        if trade["id"] <= checkpoint.seq:
+            continue
+        position = apply_trade(position, trade["side"], float(trade["amount"]), float(trade["nav"]), trade["id"])
+    return position
+
+
+def load_trades(client, username: str, fund_code: str = None, after_seq: int = 0) -> List[dict]:
+    """读取检查点之后的流水（按 id 升序）"""
+    query = client.table("transactions").select("*").eq("username", username).gt("id", after_seq)
+    if fund_code:
+        query = query.eq("fund_code", fund_code)
+    return query.order("id").execute().data or []
+
+
+def find_stale_positions(client, username: str, positions: Dict[str, Position]) -> Dict[str, Position]:
+    """
+    核对持仓行与账本：一次查询读取最早检查点之后的流水，逐基金从各自检查点重放。
+
+    返回账本领先于持仓行（有流水未计入）的基金及其重放后的持仓；一致的基金不出现在结果中。
+    """
+    if not positions:
+        return {}
+    trades = load_trades(client, username, after_seq=min(p.seq for p in positions.values()))
+    by_fund: Dict[str, List[dict]] = {}
+    for trade in trades:
+        by_fund.setdefault(trade["fund_code"], []).append(trade)
+    stale = {}
+    for code, checkpoint in positions.items():
+        replayed = replay(checkpoint, by_fund.get(code, []))
+        if replayed.seq > checkpoint.seq:
+            stale[code] = replayed
+    return stale
+
+
+def repair_position(client, username: str, fund_code: str, position: Position, version: int) -> int:
+    """把重放结果写回持仓行（版本号或检查点不匹配时抛 PortfolioConflict），返回新版本号"""
+    try:
+        response = client.rpc("repair_position", {
+            "p_username": username,
+            "p_fund_code": fund_code,
+            "p_position": {
+                "shares": position.shares,
+                "cost_price": position.cost_price,
+                "realized_pnl": position.realized_pnl,
+                "seq": position.seq,
+                "version": version,
+            },
+        }).execute()
+    except Exception as e:
+        if "portfolio_conflict" in str(e):
+            raise PortfolioConflict(str(e)) from e
+        raise
+    return int(response.data[0]["new_version"])
+
+
+def record_trade(client, username: str, fund_code: str, trade_date: str, side: str,
+                 amount: float, nav: float, position: Position, version: int) -> Position:
+    """
+    追加一笔流水并同步更新持仓聚合，两者在同一个 RPC 事务内完成。
+
+    position / version 为提交前的持仓与其版本号；版本不一致时数据库抛出 portfolio_conflict。
+    返回计入本笔流水后的新持仓。
+    """
+    new_position = apply_trade(position, side, amount, nav)
+    try:
+        response = client.rpc("record_trade", {
+            "p_username": username,
+            "p_trade": {
+                "fund_code": fund_code,
+                "trade_date": trade_date,
+                "side": side,
+                "amount": amount,
+                "nav": nav,
+                "shares": amount / nav,
+            },
+            "p_position": {
+                "shares": new_position.shares,
+                "cost_price": new_position.cost_price,
+                "realized_pnl": new_position.realized_pnl,
+                "version": version,
+            },
+        }).execute()
+    except Exception as e:
+        if "portfolio_conflict" in str(e):
+            raise PortfolioConflict(str(e)) from e
+        raise
+    return new_position._replace(seq=int(response.data[0]["trade_id"]))
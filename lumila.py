@@ -5,11 +5,27 @@ import streamlit as st
 import pandas as pd
 import os
 import time
-import requests
-import json
-from openai import OpenAI
-from supabase import create_client, Client
-import numpy as np
+from datetime import date, datetime, timedelta
+from quote_cache import MARKET_TZ, QuoteCache, is_trading_time
+from tick_buffer import TickBuffer
+from portfolio_io import (HoldingsImportError, export_holdings_csv, normalize_holdings,
+                          read_holdings_file, split_new_holdings)
+from portfolio_store import (
+    ACCOUNTS, PortfolioConflict, apply_portfolio_changes, empty_portfolio, fetch_closed_realized, fetch_portfolio,
+    fetch_portfolio_version, fetch_portfolio_versions, fetch_portfolios
+)
+from ledger import SIDE_LABELS, InsufficientShares, Position, find_stale_positions, record_trade, repair_position
+from valuation import quotes_to_frame, totals_by, value_portfolio
+from nav_store import NavStore
+from snapshots import fetch_latest_snapshots, fetch_snapshot_history, snapshot_funds
+from analytics import PortfolioAnalytics
+from fund_index import FundIndex
+from market_data import MarketDataError, breaker_states, fetch_fund_list
+from ai_chat import build_messages, build_system_prompt, make_client, stream_reply
+from tracing import export_jsonl, export_prometheus, finish_trace, incr, recent_traces, span, start_trace, traced
+
+# 本次重跑的耗时追踪（页面末尾结束并计入汇总）
+rerun_trace = start_trace("rerun")
 
 # ============================
 # 1. API 配置（从环境变量安全读取）
@@ -23,9 +39,16 @@ if not SUPABASE_URL or not SUPABASE_KEY:
     st.error("❌ 未配置 Supabase 凭据！请在 Streamlit Cloud Settings → Secrets 中添加：\nSUPABASE_URL 和 SUPABASE_KEY")
     st.stop()
 
-# 初始化 Supabase 客户端
+@st.cache_resource(show_spinner=False)
+def get_supabase_client():
+    """每个进程只创建一次 Supabase 客户端（页面重跑与所有会话共用）"""
+    from supabase import create_client
+    with span("supabase.create_client"):
+        return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+# 初始化 Supabase 客户端（创建失败不会被缓存，下次重跑会重试）
 try:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    supabase = get_supabase_client()
 except Exception as e:
     st.error(f"❌ Supabase 连接失败: {str(e)}\n请检查 Secrets 配置是否正确")
     st.stop()
@@ -33,61 +56,176 @@ except Exception as e:
 # ============================
 # 2. Supabase 数据操作函数（核心替换）
 # ============================
+@traced("supabase.load_portfolio")
 def load_portfolio(username: str) -> pd.DataFrame:
-    """从 Supabase 加载用户持仓数据"""
+    """从 Supabase 加载用户持仓数据（会话内缓存：云端版本号未变时不重新查询整表）"""
+    cache = st.session_state.setdefault("portfolio_cache", {})
     try:
-        response = supabase.table("portfolios").select("*").eq("username", username).execute()
-        if not response.data:
-            return pd.DataFrame(columns=["基金代码", "基金名称", "持有份额", "成本单价"])
-        
-        # 转换并重命名列
-        df = pd.DataFrame(response.data)
-        df = df.rename(columns={
-            "fund_code": "基金代码",
-            "fund_name": "基金名称",
-            "shares": "持有份额",
-            "cost_price": "成本单价"
-        })
-        # 确保列顺序和类型
-        df = df[["基金代码", "基金名称", "持有份额", "成本单价"]].copy()
-        df["持有份额"] = pd.to_numeric(df["持有份额"], errors='coerce').fillna(0)
-        df["成本单价"] = pd.to_numeric(df["成本单价"], errors='coerce').fillna(0)
-        return df
+        version = fetch_portfolio_version(supabase, username)
+    except Exception:
+        version = None  # 版本表不可用时退回每次全量加载
+    cached = cache.get(username)
+    if version is not None and cached is not None and cached[0] == version:
+        incr("portfolio_cache.hit")
+        return cached[1].copy()
+
+    incr("portfolio_cache.miss")
+    try:
+        df = fetch_portfolio(supabase, username)
     except Exception as e:
         st.error(f"⚠️ 加载 {username} 的持仓失败: {str(e)}")
-        return pd.DataFrame(columns=["基金代码", "基金名称", "持有份额", "成本单价"])
-
-def save_portfolio(username: str, df: pd.DataFrame) -> bool:
-    """保存持仓到 Supabase（覆盖式更新）"""
+        return empty_portfolio()
+    if version is not None:
+        cache[username] = (version, df)
+    return df.copy()
+
+# 账户选择中的汇总选项（也用作会话缓存的键）
+HOUSEHOLD = "👨‍👩‍👧 全家汇总"
+
+@traced("supabase.load_household")
+def load_household(usernames: list) -> pd.DataFrame:
+    """一次查询加载全部账户的持仓（带 账户 列），版本号同样一次查询，未变化时走会话缓存"""
+    cache = st.session_state.setdefault("portfolio_cache", {})
     try:
-        # 1. 删除该用户所有旧记录
-        supabase.table("portfolios").delete().eq("username", username).execute()
-        
-        # 2. 准备新记录（仅保留必要列）
-        if df.empty:
-            return True
-            
-        records = df[["基金代码", "基金名称", "持有份额", "成本单价"]].rename(columns={
-            "基金代码": "fund_code",
-            "基金名称": "fund_name",
-            "持有份额": "shares",
-            "成本单价": "cost_price"
-        }).to_dict('records')
-        
-        # 3. 添加用户名并插入
-        for record in records:
-            record["username"] = username
-            # 确保数值类型
-            record["shares"] = float(record["shares"]) if record["shares"] else 0.0
-            record["cost_price"] = float(record["cost_price"]) if record["cost_price"] else 0.0
-        
-        if records:
-            supabase.table("portfolios").upsert(records).execute()
+        versions = fetch_portfolio_versions(supabase, usernames)
+        key = tuple(versions[u] for u in usernames)
+    except Exception:
+        versions, key = None, None
+    cached = cache.get(HOUSEHOLD)
+    if key is not None and cached is not None and cached[0] == key:
+        incr("portfolio_cache.hit")
+        return cached[1].copy()
+
+    incr("portfolio_cache.miss")
+    try:
+        df = fetch_portfolios(supabase, usernames)
+    except Exception as e:
+        st.error(f"⚠️ 加载全家持仓失败: {str(e)}")
+        return pd.concat([pd.DataFrame(columns=["账户"]), empty_portfolio()], axis=1)
+    if versions is not None:
+        cache[HOUSEHOLD] = (key, df)
+        # 顺带填充单账户缓存，之后切换到单个账户无需再查整表
+        for u in usernames:
+            cache[u] = (versions[u], df[df["账户"] == u].drop(columns="账户").reset_index(drop=True))
+    return df.copy()
+
+def invalidate_portfolio_cache(username: str):
+    """本地写入（或写入冲突）后丢弃缓存，下次重跑全量加载"""
+    cache = st.session_state.setdefault("portfolio_cache", {})
+    cache.pop(username, None)
+    cache.pop(HOUSEHOLD, None)
+
+def cached_portfolio_version(username: str):
+    """会话缓存中该账户持仓的版本号（未缓存时为 None）"""
+    cached = st.session_state.get("portfolio_cache", {}).get(username)
+    return cached[0] if cached else None
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_latest_snapshots(usernames: tuple) -> dict:
+    """各账户最新的估值快照（由 snapshot_job.py 定时写入）；出错时抛异常，不会被缓存"""
+    with span("supabase.latest_snapshots"):
+        return fetch_latest_snapshots(supabase, usernames)
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _export_csv_cached(username: str, version, _df: pd.DataFrame) -> bytes:
+    return b"".join(export_holdings_csv(_df))
+
+def export_portfolio_csv(username: str, df: pd.DataFrame) -> bytes:
+    """导出持仓 CSV：按 账户 + 云端版本号缓存，持仓未变时重跑不再重新编码；版本号不可用时直接生成"""
+    version = cached_portfolio_version(username)
+    if version is None:
+        return b"".join(export_holdings_csv(df))
+    return _export_csv_cached(username, version, df)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _closed_realized_cached(usernames: tuple, versions: tuple) -> dict:
+    with span("supabase.closed_realized"):
+        return fetch_closed_realized(supabase, usernames)
+
+def load_closed_realized(usernames: list) -> dict:
+    """已移除持仓行的已实现收益（移除记录会让版本号递增，按版本号缓存；版本号不可用时直接查询）"""
+    versions = tuple(cached_portfolio_version(u) for u in usernames)
+    try:
+        if None in versions:
+            return fetch_closed_realized(supabase, usernames)
+        return _closed_realized_cached(tuple(usernames), versions)
+    except Exception as e:
+        st.warning(f"⚠️ 读取已移除持仓的已实现收益失败: {str(e)}")
+        return {u: 0.0 for u in usernames}
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_snapshot_history(usernames: tuple, days: int) -> pd.DataFrame:
+    """近 days 天的每日收盘快照汇总（按日期合计所选账户）"""
+    with span("supabase.snapshot_history"):
+        df = fetch_snapshot_history(supabase, usernames, date.today() - timedelta(days=days))
+    df["累计盈亏"] = df["total_h"] + df["realized"]
+    return df.groupby("snap_date")[["total_v", "total_d", "累计盈亏"]].sum().rename(
+        columns={"total_v": "总资产", "total_d": "当日盈亏"}
+    )
+
+@traced("supabase.save_portfolio")
+def save_portfolio(username: str, base_df: pd.DataFrame, new_df: pd.DataFrame, chunk_size: int = 0) -> bool:
+    """保存持仓到 Supabase（只提交相对 base_df 的增删改；默认单事务执行，批量导入时按 chunk_size 分批）"""
+    try:
+        apply_portfolio_changes(supabase, username, base_df, new_df, chunk_size=chunk_size)
+        invalidate_portfolio_cache(username)
         return True
+    except PortfolioConflict:
+        invalidate_portfolio_cache(username)
+        st.error(f"❌ {username} 的持仓已在其他页面被修改，请刷新后重试")
+        return False
     except Exception as e:
         st.error(f"❌ 保存 {username} 的持仓失败: {str(e)}")
         return False
 
+def row_position(row: pd.Series) -> Position:
+    """持仓行 → 账本检查点"""
+    return Position(
+        shares=float(row['持有份额']),
+        cost_price=float(row['成本单价']),
+        realized_pnl=float(row['已实现收益']),
+        seq=int(row['账本序号']),
+    )
+
+@traced("supabase.reconcile_ledger")
+def reconcile_ledger(username: str, df: pd.DataFrame) -> int:
+    """核对持仓行与交易流水，账本领先的基金按重放结果写回；返回修复的基金数"""
+    df = df.drop_duplicates("基金代码")
+    positions = {row['基金代码']: row_position(row) for _, row in df.iterrows()}
+    versions = dict(zip(df['基金代码'], df['版本']))
+    stale = find_stale_positions(supabase, username, positions)
+    for code, position in stale.items():
+        repair_position(supabase, username, code, position, int(versions[code]))
+    if stale:
+        invalidate_portfolio_cache(username)
+    return len(stale)
+
+@traced("supabase.record_trade")
+def submit_trade(username: str, row: pd.Series, trade_date: str, side: str, amount: float, nav: float):
+    """记一笔交易流水并更新该基金持仓，成功返回新持仓（Position），失败返回 None"""
+    position = row_position(row)
+    try:
+        new_position = record_trade(supabase, username, row['基金代码'], trade_date, side, amount, nav,
+                                    position, int(row['版本']))
+        invalidate_portfolio_cache(username)
+        return new_position
+    except InsufficientShares as e:
+        st.error(f"❌ 份额不足！需卖出 {e.requested:.2f}，但你只有 {e.available:.2f}")
+    except PortfolioConflict:
+        invalidate_portfolio_cache(username)
+        st.error(f"❌ {username} 的持仓已在其他页面被修改，请刷新后重试")
+    except Exception as e:
+        st.error(f"❌ 提交 {username} 的交易失败: {str(e)}")
+    return None
+
+def rerun_page(pause: float = 0.0):
+    """（可选）停顿片刻让提示可见，然后结束本次追踪并重跑页面"""
+    if pause:
+        with span("sleep_before_rerun"):
+            time.sleep(pause)
+    finish_trace(rerun_trace)
+    st.rerun()
+
 # ============================
 # 3. 页面基础配置
 # ============================
@@ -122,40 +260,123 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ============================
-# 5. 基金行情抓取函数（保持不变）
+# 5. 基金行情抓取函数
 # ============================
-@st.cache_data(ttl=60)
+# 整个行情批次的最长等待时间（秒）
+QUOTE_DEADLINE = 5.0
+
+@st.cache_resource
+def get_tick_buffer() -> TickBuffer:
+    """进程内共享的盘中分时记录（内存上限固定）"""
+    return TickBuffer()
+
+@st.cache_resource
+def get_quote_cache() -> QuoteCache:
+    """进程内所有会话共享的行情缓存（自带后台刷新线程，交易时段的行情同时写入分时记录）"""
+    cache = QuoteCache(deadline=QUOTE_DEADLINE, ticks=get_tick_buffer())
+    cache.start()
+    return cache
+
 def fetch_fund_data(code):
-    code = str(code).zfill(6)
+    return get_quote_cache().get(code)
+
+@traced("quotes.batch")
+def fetch_fund_batch(codes):
+    """批量读取持仓行情（过期数据先返回、后台刷新），返回 {代码: QuoteResult}"""
+    cache = get_quote_cache()
+    cache.track(codes)
+    return cache.get_many(codes)
+
+@st.cache_resource
+def get_nav_store() -> NavStore:
+    """进程内共享的本地历史净值库"""
+    return NavStore()
+
+@traced("nav.lookup")
+def get_history_nav(code, date_str):
+    """查询某日单位净值：优先本地库，缺失时按区间批量回补（查不到或服务不可用返回 None）"""
     try:
-        url = f"http://fundgz.1234567.com.cn/js/{code}.js"
-        r = requests.get(url, timeout=3)
-        if "jsonpgz" in r.text:
-            data = json.loads(r.text[r.text.find('{'):r.text.rfind('}') + 1])
-            return (
-                float(data['dwjz']),
-                float(data['gsz']),
-                float(data['gszzl']),
-                data['name'],
-                data['jzrq'],
-                True
-            )
-    except:
-        pass
-    return 1.0, 1.0, 0.0, "未找到", "-", False
+        return get_nav_store().lookup(code, date_str) or None
+    except MarketDataError as e:
+        st.toast(f"⚠️ 净值服务暂不可用: {e}", icon="⚠️")
+        return None
+
+# 基金目录每天刷新一次
+FUND_INDEX_TTL = 24 * 3600
+
+@st.cache_resource(ttl=FUND_INDEX_TTL, show_spinner="正在加载基金目录...")
+def get_fund_index() -> FundIndex:
+    """全市场基金目录索引（进程内共享，失败时抛异常、不会被缓存）"""
+    with span("fund_index.load"):
+        return FundIndex(fetch_fund_list())
+
+@st.cache_resource
+def _fund_index_failure() -> dict:
+    return {"at": 0.0}
+
+def get_fund_index_safe():
+    """取基金目录；加载失败后 5 分钟内不再重试，直接返回 None"""
+    failure = _fund_index_failure()
+    if time.time() - failure["at"] < 300:
+        return None
+    try:
+        return get_fund_index()
+    except Exception:
+        failure["at"] = time.time()
+        return None
+
+def lookup_fund_name(code):
+    """按代码查基金名称：优先本地目录，目录不可用时退回行情接口"""
+    fund_index = get_fund_index_safe()
+    if fund_index is not None:
+        hit = fund_index.get(code)
+        return hit["name"] if hit else None
+    _, _, _, nm, _, ok = fetch_fund_data(code)
+    return nm if ok else None
+
+# 历史分析可选区间（天）
+ANALYTICS_PERIODS = {"近1年": 365, "近3年": 365 * 3}
+
+@st.cache_resource(max_entries=16)
+def get_portfolio_analytics(codes: tuple, days: int) -> PortfolioAnalytics:
+    """按持仓代码组合缓存净值矩阵；首次构建时并发回补区间净值，之后只追加新交易日（回补失败的基金在 sync 时重试）"""
+    store = get_nav_store()
+    end = date.today()
+    start = end - timedelta(days=days)
+    with span("nav.backfill_many", funds=len(codes)):
+        results = store.backfill_many(codes, start, end)
+    failed = [c for c, n in results.items() if n < 0]
+    return PortfolioAnalytics.from_store(store, codes, start, end, incomplete=failed)
 
 # ============================
 # 6. 侧边栏：持仓管理（Supabase 集成版）
 # ============================
 with st.sidebar:
     st.markdown("## 👤 账户切换")
-    user_list = ["噜噜", "咪咪"]
-    history_profit_patch = st.number_input("🛠️ 历史盈亏修正总额", value=0.0)
-    current_user = st.selectbox("选择当前查看的账户", user_list)
-    
+    user_list = list(ACCOUNTS)
+    history_profit_patch = st.number_input(
+        "🛠️ 建账前历史盈亏修正", value=0.0,
+        help="卖出产生的已实现收益已由交易流水自动计入，这里只需填写启用流水之前的历史盈亏"
+    )
+    view_choice = st.selectbox("选择当前查看的账户", user_list + [HOUSEHOLD])
+    household = view_choice == HOUSEHOLD
+
     # ✅ 关键替换：不再使用本地文件，直接加载 Supabase 数据
-    df_db = load_portfolio(current_user)
-    st.info(f"☁️ 当前查看: **{current_user}** 的云端持仓 | 记录数: {len(df_db)}")
+    # df_db = 正在管理的账户持仓；df_shown = 主看板展示的持仓（汇总时为全部账户，带 账户 列）
+    if household:
+        df_shown = load_household(user_list)
+        current_user = st.selectbox("管理账户", user_list, help="汇总视图下，下方的持仓管理面板作用于该账户")
+        df_db = df_shown[df_shown["账户"] == current_user].drop(columns="账户").reset_index(drop=True)
+        st.info(f"☁️ 当前查看: **全家汇总**（{len(user_list)} 个账户）| 记录数: {len(df_shown)}")
+    else:
+        current_user = view_choice
+        df_db = load_portfolio(current_user)
+        df_shown = df_db
+        st.info(f"☁️ 当前查看: **{current_user}** 的云端持仓 | 记录数: {len(df_db)}")
+    use_snapshot = st.toggle("⚡ 快照模式", key="use_snapshot",
+                             help="直接展示定时任务算好的最新估值快照，不抓取实时行情")
+    live_quotes = st.toggle("⏱️ 盘中自动刷新", key="live_quotes",
+                            help="交易时段内只按间隔刷新指标卡片、持仓表与分时走势，侧边栏和表单不重跑")
     st.markdown("---")
 
 # --- 快捷添加新持仓 ---
@@ -166,21 +387,47 @@ with st.sidebar:
         def auto_fill_name():
             code = st.session_state.get("add_code", "")
             if code and len(code) == 6:
-                _, _, _, nm, _, ok = fetch_fund_data(code)
-                if ok:
+                nm = lookup_fund_name(code)
+                if nm:
                     st.session_state.add_name = nm
                 else:
                     st.toast(f"未找到代码 {code} 的信息", icon="⚠️")
 
+        def pick_search_result():
+            picked = st.session_state.get("add_pick")
+            if picked:
+                code, _, nm = picked.partition(" - ")
+                st.session_state.add_code = code
+                st.session_state.add_name = nm
+
+        # 折叠的面板每次重跑也会执行：基金目录只在用户真正输入搜索词时才加载
+        query = st.text_input("🔎 搜索基金", key="add_query", placeholder="代码 / 名称 / 拼音首字母")
+        if query:
+            with st.spinner("正在加载基金目录…"):
+                fund_index = get_fund_index_safe()
+            if fund_index is None:
+                st.caption("⚠️ 基金目录暂不可用，请直接在下方输入 6 位代码（名称将按行情接口补全）")
+            else:
+                with span("fund_index.search"):
+                    matches = fund_index.search(query, limit=20)
+                st.selectbox(
+                    "匹配结果", [f"{m['code']} - {m['name']}" for m in matches],
+                    index=None, placeholder=f"共 {len(matches)} 条，选择后自动填入",
+                    key="add_pick", on_change=pick_search_result
+                )
+
         in_code = st.text_input("基金代码 (6位)", key="add_code", on_change=auto_fill_name)
         f_name = st.text_input("确认名称", key="add_name")
         f_cost = st.number_input("持仓成本单价", format="%.4f", key="add_cost")
         f_share = st.number_input("持有份额", format="%.2f", key="add_share")
 
         if st.button("🚀 初始入库", use_container_width=True):
-            if f_name and f_share > 0 and in_code:
-                # 读取当前数据 → 添加新行 → 保存
-                current_df = load_portfolio(current_user)
+            if in_code and in_code.zfill(6) in set(df_db['基金代码']):
+                # 已有持仓不能在这里覆盖：加仓需走交易流水，份额与成本才会正确累计
+                st.warning(f"⚠️ {in_code.zfill(6)} 已在持仓中，加仓请使用下方的「存量交易管理」买入")
+            elif f_name and f_share > 0 and in_code:
+                # 本次重跑已加载的持仓 → 添加新行 → 只提交差异（版本号保证没有覆盖他人修改）
+                current_df = df_db
                 new_row = pd.DataFrame([{
                     "基金代码": in_code.zfill(6),
                     "基金名称": f_name,
@@ -188,27 +435,59 @@ with st.sidebar:
                     "成本单价": f_cost
                 }])
                 updated_df = pd.concat([current_df, new_row], ignore_index=True)
-                if save_portfolio(current_user, updated_df):
+                if save_portfolio(current_user, current_df, updated_df):
                     st.success(f"✅ 已存入云端: {f_name}")
-                    time.sleep(1)
-                    st.rerun()
+                    rerun_page(pause=1)
+
+# --- 批量导入 / 导出 ---
+# 每批提交的行数：500 行持仓的迁移约 3 次 RPC
+IMPORT_CHUNK_ROWS = 200
 
-# --- 存量交易管理 ---
 with st.sidebar:
-    with st.expander("🔄 存量交易管理 (买入/卖出)", expanded=True):
-        def get_history_nav(code, date_str):
+    with st.expander("📦 批量导入 / 导出", expanded=False):
+        uploaded = st.file_uploader("上传持仓文件（CSV / Excel / 券商导出）", type=["csv", "txt", "xlsx", "xls"],
+                                    help="需包含 基金代码、持有份额 两列，成本单价、基金名称 可选")
+        if uploaded is not None:
             try:
-                ts = int(time.time() * 1000)
-                url = f"http://api.fund.eastmoney.com/f10/lsjz?fundCode={code}&pageIndex=1&pageSize=1&startDate={date_str}&endDate={date_str}&_={ts}"
-                headers = {"Referer": "http://fundf10.eastmoney.com/"}
-                r = requests.get(url, headers=headers, timeout=2)
-                data = r.json()
-                if data['Data']['LSJZList']:
-                    return float(data['Data']['LSJZList'][0]['DWJZ'])
-            except:
-                pass
-            return 0.0
+                with span("import.parse"):
+                    incoming, rejected = normalize_holdings(read_holdings_file(uploaded.getvalue(), uploaded.name))
+            except HoldingsImportError as e:
+                st.error(f"❌ {e}")
+            else:
+                # 文件里没有名称的基金，用基金目录补全
+                fund_index = get_fund_index_safe()
+                if fund_index is not None:
+                    blank = incoming["基金名称"] == ""
+                    incoming.loc[blank, "基金名称"] = [
+                        (fund_index.get(c) or {}).get("name", "") for c in incoming.loc[blank, "基金代码"]
+                    ]
+                st.caption(f"识别 {len(incoming)} 只基金" + (f"，跳过 {len(rejected)} 行无效数据" if len(rejected) else ""))
+                fresh, held = split_new_holdings(df_db, incoming)
+                st.dataframe(fresh, hide_index=True, use_container_width=True, height=180)
+                if not held.empty:
+                    # 与快捷添加一致：已持有基金的份额变动必须记入交易流水，不能由导入直接覆盖
+                    st.warning(f"⚠️ {len(held)} 只基金已在持仓中，不会导入（{', '.join(held['基金代码'])}），"
+                               f"加减仓请使用下方的「存量交易管理」")
+                if st.button("📥 确认导入", use_container_width=True, disabled=fresh.empty):
+                    merged = pd.concat([df_db, fresh], ignore_index=True)
+                    with span("import.save", rows=len(fresh)):
+                        ok = save_portfolio(current_user, df_db, merged, chunk_size=IMPORT_CHUNK_ROWS)
+                    if ok:
+                        st.success(f"✅ 已导入 {len(fresh)} 只基金")
+                        rerun_page(pause=1)
+
+        st.download_button(
+            "📤 导出当前持仓 (CSV)",
+            data=export_portfolio_csv(current_user, df_db),
+            file_name=f"{current_user}_持仓_{date.today():%Y%m%d}.csv",
+            mime="text/csv",
+            use_container_width=True,
+            disabled=df_db.empty,
+        )
 
+# --- 存量交易管理 ---
+with st.sidebar:
+    with st.expander("🔄 存量交易管理 (买入/卖出)", expanded=True):
         if not df_db.empty:
             fund_options = df_db.apply(lambda x: f"{x['基金代码']} - {x['基金名称']}", axis=1).tolist()
             trade_target = st.selectbox("选择操作基金", fund_options)
@@ -229,7 +508,7 @@ with st.sidebar:
                 st.write(" ")
                 if st.button("🔍 抓取", use_container_width=True):
                     fetched_nav = get_history_nav(trade_code, str(trade_date))
-                    if fetched_nav > 0:
+                    if fetched_nav:
                         st.session_state[f"nav_{trade_code}"] = fetched_nav
                         st.toast(f"✅ 获取 {trade_date} 净值: {fetched_nav:.4f}")
                     else:
@@ -245,94 +524,137 @@ with st.sidebar:
 
             if st.button("🚀 确认提交交易", use_container_width=True):
                 if t_amount > 0 and t_price > 0:
-                    current_df = load_portfolio(current_user)
-                    rows = current_df[current_df['基金代码'] == trade_code]
-                    if rows.empty:
-                        st.error("❌ 未找到该基金记录")
-                        st.stop()
-                    idx = rows.index[0]
-
-                    old_share = float(current_df.at[idx, '持有份额'])
-                    old_cost = float(current_df.at[idx, '成本单价'])
-                    calc_share = t_amount / t_price
-
-                    if t_type == "买入":
-                        new_share_part = calc_share
-                        new_total_share = old_share + new_share_part
-                        new_avg_cost = ((old_share * old_cost) + t_amount) / new_total_share
-                        current_df.at[idx, '持有份额'] = new_total_share
-                        current_df.at[idx, '成本单价'] = new_avg_cost
-                        if save_portfolio(current_user, current_df):
-                            st.success(f"✅ 加仓成功！份额 +{new_share_part:.2f}")
-                            time.sleep(1)
-                            st.rerun()
-                    else:  # 卖出
-                        if calc_share > old_share + 0.01:
-                            st.error(f"❌ 份额不足！需卖出 {calc_share:.2f}，但你只有 {old_share:.2f}")
-                            st.stop()
-                        remain = old_share - calc_share
-                        if remain < 0.01:
-                            current_df.at[idx, '持有份额'] = 0.0
+                    row = df_db[df_db['基金代码'] == trade_code].iloc[0]
+                    old_share = float(row['持有份额'])
+                    side = SIDE_LABELS[t_type]
+                    new_position = submit_trade(current_user, row, str(trade_date), side, t_amount, t_price)
+                    if new_position is not None:
+                        if side == "buy":
+                            st.success(f"✅ 加仓成功！份额 +{new_position.shares - old_share:.2f}")
+                        elif new_position.shares == 0:
                             st.success("🎉 已全额卖出！记录已保留（份额=0）")
                         else:
-                            current_df.at[idx, '持有份额'] = remain
-                            st.success(f"✅ 减仓成功！份额减少 {calc_share:.2f}")
-                        if save_portfolio(current_user, current_df):
-                            time.sleep(1)
-                            st.rerun()
+                            st.success(f"✅ 减仓成功！份额减少 {old_share - new_position.shares:.2f}")
+                        rerun_page(pause=1)
+
+            if st.button("🧾 核对账本", use_container_width=True, help="按交易流水重放，修复落后于账本的持仓"):
+                try:
+                    repaired = reconcile_ledger(current_user, df_db)
+                except PortfolioConflict:
+                    invalidate_portfolio_cache(current_user)
+                    st.error(f"❌ {current_user} 的持仓已在其他页面被修改，请刷新后重试")
+                except Exception as e:
+                    st.error(f"❌ 核对账本失败: {str(e)}")
+                else:
+                    if repaired:
+                        st.success(f"✅ 已按交易流水修复 {repaired} 只基金的持仓")
+                        rerun_page(pause=1)
+                    else:
+                        st.toast("✅ 持仓与账本一致")
         else:
             st.info("💡 请先添加持仓记录")
 
 # ============================
 # 7. 核心收益计算逻辑（使用云端数据）
 # ============================
+# 持仓表格展示的列（估值结果另含 成本 / 现价）
+VIEW_COLUMNS = ["代码", "基金名称", "占比", "持有金额", "涨幅", "当日收益", "累计收益", "收益率"]
+# 汇总视图额外按账户分组
+GROUP_COLUMNS = ["账户"] if household else []
+
 view_data = []
 total_v = 0.0
 total_d = 0.0
 total_h = 0.0
+total_realized = 0.0
+failed_quotes = {}
+account_totals = None
+shown_accounts = user_list if household else [current_user]
+snapshot_info = None
 
-if not df_db.empty:
-    temp_list = []
-    for _, row in df_db.iterrows():
-        dwjz, gsz, zf, nm, jzrq, ok = fetch_fund_data(row['基金代码'])
-        share = float(row['持有份额'])
-        cost = float(row['成本单价'])
-        
-        # 跳过份额为0的记录（已清仓）
-        if share < 0.01:
-            continue
-            
-        yest_val = share * dwjz
-        day_inc = yest_val * (zf / 100)
-        hold_inc = (gsz - cost) * share
-
-        total_v += yest_val
-        total_d += day_inc
-        total_h += hold_inc
-
-        temp_list.append({
-            "代码": row['基金代码'], "基金名称": nm, "持有金额": yest_val,
-            "涨幅": zf, "当日收益": day_inc, "累计收益": hold_inc, "成本": cost, "现价": gsz
-        })
-
-    for item in temp_list:
-        portion = (item['持有金额'] / total_v * 100) if total_v > 0 else 0
-        rate = ((item['现价'] - item['成本']) / (item['成本'] + 1e-6) * 100)
-        view_data.append({
-            "选": False,
-            "代码": item['代码'],
-            "基金名称": item['基金名称'],
-            "占比": round(portion, 2),
-            "持有金额": round(item['持有金额'], 2),
-            "涨幅": round(item['涨幅'], 2),
-            "当日收益": round(item['当日收益'], 2),
-            "累计收益": round(item['累计收益'], 2),
-            "收益率": round(rate, 2)
-        })
+if use_snapshot and not df_shown.empty:
+    try:
+        snaps = load_latest_snapshots(tuple(shown_accounts))
+    except Exception as e:
+        snaps = {}
+        st.warning(f"⚠️ 读取估值快照失败: {str(e)}")
+    if all(u in snaps for u in shown_accounts):
+        # 直接使用定时任务的估值结果：不抓行情、不重新计算
+        with span("snapshot.render"):
+            fund_values = pd.concat(
+                [snapshot_funds(snaps[u]).assign(账户=u) for u in shown_accounts], ignore_index=True
+            )
+            account_totals = pd.DataFrame(
+                [{k: float(snaps[u][k]) for k in ("total_v", "total_d", "total_h", "realized")} for u in shown_accounts],
+                index=shown_accounts,
+            )
+            total_v, total_d, total_h, total_realized = account_totals.sum()
+            fund_values["占比"] = fund_values["持有金额"] / total_v * 100 if total_v > 0 else 0.0
+        snapshot_info = {
+            "taken_at": min(pd.Timestamp(snaps[u]["taken_at"]) for u in shown_accounts),
+            "stale": [u for u in shown_accounts
+                      if cached_portfolio_version(u) not in (None, snaps[u]["portfolio_version"])],
+            "missing": sum(int(snaps[u]["missing"]) for u in shown_accounts),
+        }
+        if not household:
+            account_totals = None
+        view_df = fund_values[GROUP_COLUMNS + VIEW_COLUMNS].round(2)
+        view_df.insert(0, "选", False)
+        view_data = view_df.to_dict("records")
+    else:
+        st.warning("⚠️ 还没有可用的估值快照（请先运行 snapshot_job.py），已改用实时行情")
+        use_snapshot = False
+
+def value_shown():
+    """
+    对主看板展示的持仓做一次估值，返回 (逐基金表, 汇总, {无行情代码: 原因}, 各账户小计或 None)。
+
+    一次性并发抓取全部持仓行情，页面耗时取决于最慢的一只而非总和（多个账户持有的同一基金只抓一次）；
+    盘中自动刷新时由片段反复调用，此时行情基本都来自进程内缓存。
+    """
+    quote_results = fetch_fund_batch(df_shown['基金代码'].tolist())
+    failures = {c: res.status for c, res in quote_results.items() if res.status != "ok"}
+
+    with span("valuation"):
+        quotes_df = quotes_to_frame({c: res.quote for c, res in quote_results.items()})
+        funds, totals = value_portfolio(df_shown, quotes_df, keep=GROUP_COLUMNS)
+    by_account = None
+    if household:
+        # 各账户小计与合计出自同一次估值
+        by_account = totals_by(funds, "账户").reindex(user_list, fill_value=0.0)
+        by_account["realized"] = (df_shown.groupby("账户")["已实现收益"].sum().reindex(user_list, fill_value=0.0)
+                                  + pd.Series(closed_realized).reindex(user_list, fill_value=0.0))
+    return funds, totals, failures, by_account
+
+# 行情缺失原因（market_data.QuoteResult.status）
+QUOTE_FAILURE_LABELS = {"not_found": "无估值", "timeout": "超时", "unavailable": "服务熔断", "error": "请求失败"}
+
+def describe_quote_failures(failures: dict) -> str:
+    items = ", ".join(f"{code}（{QUOTE_FAILURE_LABELS.get(status, status)}）" for code, status in failures.items())
+    return f"⚠️ 以下基金暂无行情，未计入总资产与盈亏: {items}"
+
+if not use_snapshot and not df_shown.empty:
+    # 已实现收益来自交易流水（含已清仓基金，以及已移除持仓行转存的部分）
+    closed_realized = load_closed_realized(shown_accounts)
+    total_realized = float(df_shown['已实现收益'].sum()) + sum(closed_realized.values())
+    fund_values, totals, failed_quotes, account_totals = value_shown()
+    total_v, total_d, total_h = totals["total_v"], totals["total_d"], totals["total_h"]
+
+    view_df = fund_values[GROUP_COLUMNS + VIEW_COLUMNS].round(2)
+    view_df.insert(0, "选", False)
+    view_data = view_df.to_dict("records")
+
+# 盘中自动刷新只在交易时段、实时估值模式下生效
+live_mode = bool(live_quotes and view_data and not use_snapshot and is_trading_time())
 
 # ============================
 # 8. AI 聊天初始化
 # ============================
+@st.cache_resource
+def get_ai_client():
+    """进程内复用同一个 DeepSeek 客户端（连接池随之复用）"""
+    return make_client(DEEPSEEK_API_KEY)
+
 if "messages" not in st.session_state:
     st.session_state.messages = []
 if "show_chat" not in st.session_state:
@@ -348,22 +670,29 @@ with st.sidebar:
         use_container_width=True
     ):
         st.session_state.show_chat = not st.session_state.show_chat
-        st.rerun()
+        rerun_page()
     if st.button("🧹 清空对话历史", use_container_width=True):
         st.session_state.messages = []
-        st.rerun()
-
-# 动态布局
-if st.session_state.show_chat:
-    col_main, col_ai = st.columns([3, 1])
-else:
-    col_main = st.container()
-
-# --- 主看板 ---
-with col_main:
-    st.title("📈 噜咪啦基金助手 (云端版)")
-    
-    # 指标卡片
+        rerun_page()
+
+# 持仓表格式（可编辑表与自动刷新表共用）
+ROW_HEIGHT = 35
+HEADER_HEIGHT = 40
+MAX_HEIGHT = 900
+HOLDING_COLUMN_CONFIG = {
+    "持有金额": st.column_config.NumberColumn(format="¥%.2f"),
+    "占比": st.column_config.ProgressColumn("持仓占比", format="%.2f%%", min_value=0, max_value=100),
+    "涨幅": st.column_config.NumberColumn("实时涨跌", format="%+.2f%%"),
+    "当日收益": st.column_config.NumberColumn(format="¥%+.2f"),
+    "累计收益": st.column_config.NumberColumn(format="¥%+.2f"),
+    "收益率": st.column_config.NumberColumn(format="%+.2f%%"),
+}
+
+# 自动刷新间隔（秒），与行情缓存后台线程的交易时段刷新间隔一致
+LIVE_REFRESH_SECONDS = 30
+
+def render_hero(total_v: float, total_d: float, total_profit: float, account_totals):
+    """指标卡片；汇总视图下另加各账户小计"""
     mc1, mc2, mc3 = st.columns(3)
     mc1.markdown(
         f'<div class="hero-card card-cyan"><div class="card-label">💰 总资产</div><div class="card-value">¥{total_v:,.2f}</div></div>',
@@ -371,58 +700,171 @@ with col_main:
     mc2.markdown(
         f'<div class="hero-card card-blue"><div class="card-label">📊 当日盈亏</div><div class="card-value">¥{total_d:+,.2f}</div></div>',
         unsafe_allow_html=True)
-    final_profit_display = total_h + history_profit_patch
     mc3.markdown(
-        f'<div class="hero-card card-yellow"><div class="card-label">🏆 累计盈亏</div><div class="card-value">¥{final_profit_display:+,.2f}</div></div>',
+        f'<div class="hero-card card-yellow"><div class="card-label">🏆 累计盈亏</div><div class="card-value">¥{total_profit:+,.2f}</div></div>',
         unsafe_allow_html=True)
 
-    # 持仓明细
+    if account_totals is not None:
+        account_cols = st.columns(len(account_totals))
+        for col, (name, row) in zip(account_cols, account_totals.iterrows()):
+            col.metric(
+                f"👤 {name}",
+                f"¥{row['total_v']:,.2f}",
+                f"当日 {row['total_d']:+,.2f} · 累计 {row['total_h'] + row['realized']:+,.2f}",
+            )
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def live_board():
+    """盘中自动刷新：重新估值并只重绘指标卡片、持仓表与分时走势（行情由后台线程保持新鲜）"""
+    if not is_trading_time():
+        # 收盘后整页重跑一次，回到普通模式
+        rerun_page()
+    with span("live.refresh"):
+        funds, totals, failures, by_account = value_shown()
+    render_hero(totals["total_v"], totals["total_d"],
+                totals["total_h"] + total_realized + history_profit_patch, by_account)
+
     st.markdown('<div class="quant-board">', unsafe_allow_html=True)
-    st.markdown("<h3>📋 持仓明细 (云端同步)</h3>", unsafe_allow_html=True)
-    
-    ca, cb = st.columns([1, 1])
-    with ca:
-        if st.button("🔄 同步行情"):
-            st.cache_data.clear()
-            st.rerun()
-    with cb:
-        btn_del = st.button("🗑️ 移除选中记录")
+    st.markdown("<h3>📋 持仓明细 (盘中自动刷新)</h3>", unsafe_allow_html=True)
+    st.caption(f"⏱️ 每 {LIVE_REFRESH_SECONDS} 秒更新 · 最近 {datetime.now(MARKET_TZ):%H:%M:%S}"
+               "；编辑或移除持仓请先关闭侧边栏的盘中自动刷新")
+    if failures:
+        st.warning(describe_quote_failures(failures))
+    st.dataframe(
+        funds[GROUP_COLUMNS + VIEW_COLUMNS].round(2),
+        hide_index=True,
+        use_container_width=True,
+        column_config=HOLDING_COLUMN_CONFIG,
+        height=min(HEADER_HEIGHT + ROW_HEIGHT * len(funds), MAX_HEIGHT),
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
 
-    if view_data:
-        df_view = pd.DataFrame(view_data)
-        ROW_HEIGHT = 35
-        HEADER_HEIGHT = 40
-        MAX_HEIGHT = 900
-        table_height = min(HEADER_HEIGHT + ROW_HEIGHT * len(df_view), MAX_HEIGHT)
+    # 当日分时：各基金估算涨幅
+    names = dict(zip(funds["代码"], funds["基金名称"]))
+    ticks = get_tick_buffer().frame(names)
+    if ticks.empty:
+        st.caption("📈 分时走势将在下一次行情刷新后出现")
+    else:
+        st.caption("📈 当日估算涨幅走势 (%)")
+        ticks.index = ticks.index.tz_localize(None)
+        st.line_chart(ticks.rename(columns=lambda c: f"{c} {names.get(c, '')}"))
+
+# 动态布局
+if st.session_state.show_chat:
+    col_main, col_ai = st.columns([3, 1])
+else:
+    col_main = st.container()
+
+# --- 主看板 ---
+with col_main:
+    st.title("📈 噜咪啦基金助手 (云端版)")
+    final_profit_display = total_h + total_realized + history_profit_patch
+
+    if live_mode:
+        # 只有这一块按间隔重跑，侧边栏、表单与下方分析不受影响
+        live_board()
+    else:
+        render_hero(total_v, total_d, final_profit_display, account_totals)
+
+        # 持仓明细
+        st.markdown('<div class="quant-board">', unsafe_allow_html=True)
+        st.markdown("<h3>📋 持仓明细 (云端同步)</h3>", unsafe_allow_html=True)
+    
+        ca, cb = st.columns([1, 1])
+        with ca:
+            if st.button("🔄 同步行情"):
+                # 只刷新当前持仓的行情，不清空其他缓存
+                get_quote_cache().refresh(df_shown['基金代码'].tolist())
+                rerun_page()
+        with cb:
+            btn_del = st.button("🗑️ 移除选中记录", disabled=household,
+                                help="汇总视图为只读，请切换到单个账户后移除" if household else None)
+
+        if failed_quotes:
+            st.warning(describe_quote_failures(failed_quotes))
+        if snapshot_info:
+            taken_at = snapshot_info["taken_at"].tz_convert("Asia/Shanghai")
+            st.caption(f"📸 快照模式：估值来自 {taken_at:%m-%d %H:%M} 的快照"
+                       + (f"，其中 {snapshot_info['missing']} 只基金当时行情缺失" if snapshot_info["missing"] else ""))
+            if snapshot_info["stale"]:
+                st.warning(f"⚠️ {', '.join(snapshot_info['stale'])} 的持仓在快照之后有变动，关闭快照模式可查看实时估值")
+
+        if view_data:
+            df_view = pd.DataFrame(view_data)
+            table_height = min(HEADER_HEIGHT + ROW_HEIGHT * len(df_view), MAX_HEIGHT)
         
-        edited_df = st.data_editor(
-            df_view,
-            hide_index=True,
-            use_container_width=True,
-            column_config={
-                "选": st.column_config.CheckboxColumn(width="small"),
-                "持有金额": st.column_config.NumberColumn(format="¥%.2f"),
-                "占比": st.column_config.ProgressColumn("持仓占比", format="%.2f%%", min_value=0, max_value=100),
-                "涨幅": st.column_config.NumberColumn("实时涨跌", format="%+.2f%%"),
-                "当日收益": st.column_config.NumberColumn(format="¥%+.2f"),
-                "累计收益": st.column_config.NumberColumn(format="¥%+.2f"),
-                "收益率": st.column_config.NumberColumn(format="%+.2f%%"),
-            },
-            height=table_height
-        )
+            edited_df = st.data_editor(
+                df_view,
+                hide_index=True,
+                use_container_width=True,
+                column_config={"选": st.column_config.CheckboxColumn(width="small"), **HOLDING_COLUMN_CONFIG},
+                height=table_height
+            )
         
-        # 删除选中记录（关键替换）
-        if btn_del:
-            to_del = edited_df[edited_df["选"] == True]["代码"].tolist()
-            if to_del:
-                updated_df = df_db[~df_db["基金代码"].isin(to_del)]
-                if save_portfolio(current_user, updated_df):
-                    st.success(f"✅ 已从云端移除 {len(to_del)} 条记录")
-                    time.sleep(1)
-                    st.rerun()
-    else:
-        st.info("💡 暂无持仓数据，请在侧边栏添加")
-    st.markdown('</div>', unsafe_allow_html=True)
+            # 删除选中记录（关键替换）
+            if btn_del:
+                to_del = edited_df[edited_df["选"] == True]["代码"].tolist()
+                if to_del:
+                    updated_df = df_db[~df_db["基金代码"].isin(to_del)]
+                    if save_portfolio(current_user, df_db, updated_df):
+                        st.success(f"✅ 已从云端移除 {len(to_del)} 条记录")
+                        rerun_page(pause=1)
+        else:
+            st.info("💡 暂无持仓数据，请在侧边栏添加")
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    # 历史表现（按当前份额回溯，首次开启需要回补净值）
+    if view_data:
+        with st.expander("📊 历史表现与风险分析", expanded=False):
+            ca, cb = st.columns([1, 1])
+            with ca:
+                show_analytics = st.toggle("加载历史分析", key="show_analytics")
+            with cb:
+                period = st.selectbox("区间", list(ANALYTICS_PERIODS), label_visibility="collapsed")
+            if show_analytics:
+                held = df_shown[df_shown['持有份额'] >= 0.01]
+                codes = tuple(sorted(set(held['基金代码'])))
+                with span("analytics"):
+                    analytics = get_portfolio_analytics(codes, ANALYTICS_PERIODS[period])
+                    analytics.sync(get_nav_store())
+                    perf = analytics.metrics(held.groupby('基金代码')['持有份额'].sum().to_dict())
+                if analytics.incomplete:
+                    st.warning(f"⚠️ {len(analytics.incomplete)} 只基金的历史净值获取失败（{', '.join(sorted(analytics.incomplete))}），"
+                               f"未计入走势，稍后会自动重试")
+                if perf["value"].empty:
+                    st.info("💡 暂无历史净值数据")
+                else:
+                    m1, m2, m3 = st.columns(3)
+                    m1.metric("区间收益", f"{perf['total_return'] * 100:+.2f}%")
+                    m2.metric("最大回撤", f"{perf['max_drawdown'] * 100:.2f}%")
+                    m3.metric("年化波动", f"{perf['volatility'] * 100:.2f}%")
+                    st.caption("按当前持有份额回溯的组合市值")
+                    st.line_chart(perf["value"].rename("组合市值"))
+                    st.caption("回撤")
+                    st.area_chart(perf["drawdown"].rename("回撤"))
+                    if not perf["rolling_vol"].empty:
+                        st.caption("20 日滚动年化波动")
+                        st.line_chart(perf["rolling_vol"].rename("滚动波动"))
+                    if len(codes) > 1:
+                        st.caption("基金日收益相关系数")
+                        st.dataframe(perf["correlation"].round(2), use_container_width=True)
+
+    # 每日收盘快照走势（由定时任务积累，不需要回补净值）
+    with st.expander("🗓️ 每日快照走势", expanded=False):
+        snap_days = st.selectbox("区间", [30, 90, 180, 365], index=1, format_func=lambda d: f"近{d}天",
+                                 key="snapshot_days", label_visibility="collapsed")
+        try:
+            snap_history = load_snapshot_history(tuple(shown_accounts), snap_days)
+        except Exception as e:
+            snap_history = None
+            st.warning(f"⚠️ 读取快照历史失败: {str(e)}")
+        if snap_history is not None and snap_history.empty:
+            st.info("💡 暂无收盘快照，定时运行 snapshot_job.py 后这里会显示每日走势")
+        elif snap_history is not None:
+            st.caption("总资产")
+            st.line_chart(snap_history["总资产"])
+            st.caption("累计盈亏（持仓收益 + 已实现收益）")
+            st.line_chart(snap_history["累计盈亏"])
 
 # --- AI 对话窗口 ---
 if st.session_state.show_chat:
@@ -447,19 +889,14 @@ if st.session_state.show_chat:
                     st.markdown(prompt)
             
             try:
-                client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url="https://api.deepseek.com")
-                fund_context = f"用户 {current_user} 的持仓: {view_data}"
-                response = client.chat.completions.create(
-                    model="deepseek-chat",
-                    messages=[
-                        {"role": "system", "content": f"你是专业基金助手，分析 {current_user} 的资产。数据: {fund_context}"},
-                        *st.session_state.messages
-                    ]
-                )
-                answer = response.choices[0].message.content
+                system_prompt = build_system_prompt(view_choice, view_data, {
+                    "total_v": total_v, "total_d": total_d, "total_h": final_profit_display
+                })
+                messages = build_messages(system_prompt, st.session_state.messages)
                 with chat_container:
                     with st.chat_message("assistant"):
-                        st.markdown(answer)
+                        with span("ai.chat", messages=len(messages)):
+                            answer = st.write_stream(stream_reply(get_ai_client(), messages))
                 st.session_state.messages.append({"role": "assistant", "content": answer})
             except Exception as e:
                 st.error("⚠️ AI 服务暂时不可用，请稍后再试")
@@ -469,3 +906,30 @@ if st.session_state.show_chat:
 # ============================
 st.markdown("---")
 st.caption("☁️ 数据已安全存储至 Supabase 云端 | 刷新页面数据不丢失 | 多设备同步查看")
+
+# ============================
+# 11. 性能调试面板（地址加 ?debug=1 或设置 LUMILA_DEBUG=1 时显示）
+# ============================
+finish_trace(rerun_trace)
+if st.query_params.get("debug") == "1" or os.environ.get("LUMILA_DEBUG") == "1":
+    with st.sidebar:
+        with st.expander("🐞 性能调试", expanded=False):
+            st.caption(f"本次重跑耗时 {rerun_trace.duration_ms:.1f} ms")
+            stage_totals = rerun_trace.totals()
+            if stage_totals:
+                st.dataframe(pd.DataFrame({
+                    "阶段": list(stage_totals),
+                    "耗时(ms)": [round(v, 1) for v in stage_totals.values()],
+                }), hide_index=True, use_container_width=True)
+            if rerun_trace.counters:
+                st.json(dict(rerun_trace.counters))
+            breakers = breaker_states()
+            if breakers:
+                st.caption("行情服务熔断器: " + " · ".join(f"{h} {state}" for h, state in breakers.items()))
+            history = recent_traces()
+            durations = sorted(t.duration_ms for t in history)
+            if durations:
+                st.caption(f"本进程最近 {len(durations)} 次重跑: p50 {durations[len(durations) // 2]:.1f} ms"
+                           f" / 最慢 {durations[-1]:.1f} ms")
+            st.download_button("📥 导出 JSONL", export_jsonl(history), file_name="lumila_traces.jsonl")
+            st.download_button("📥 导出 Prometheus 指标", export_prometheus(), file_name="lumila_metrics.prom")
@@ -0,0 +1,300 @@
+# ============================
+# 基金行情抓取（天天基金 fundgz 估值接口）
+# 与 Streamlit 无关：页面、批处理任务都可以直接调用
+# ============================
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from tracing import incr
+
+FUNDGZ_BASE = os.environ.get("FUNDGZ_BASE", "http://fundgz.1234567.com.cn")
+EASTMONEY_BASE = os.environ.get("EASTMONEY_BASE", "http://api.fund.eastmoney.com")
+FUND_LIST_BASE = os.environ.get("FUND_LIST_BASE", "http://fund.eastmoney.com")
+
+# 东方财富历史净值接口单页条数上限
+NAV_PAGE_SIZE = 20
+
+# 每个主机的连接池大小（不小于批量抓取的并发线程数）
+HTTP_POOL_SIZE = 16
+# 单次请求超时（连接, 读取）秒
+QUOTE_TIMEOUT = (2, 3)
+# 失败后的重试次数；第 n 次重试前等待 RETRY_BACKOFF × 2^n × [0.5, 1.5) 秒
+HTTP_RETRIES = 2
+RETRY_BACKOFF = 0.2
+# 需要重试的 HTTP 状态码
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# 同一主机连续失败 BREAKER_THRESHOLD 次后熔断，BREAKER_COOLDOWN 秒后放行一次试探请求
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30.0
+
+# 查不到行情时的占位 (dwjz, gsz, gszzl, name, jzrq, ok)：数值为 NaN，不参与估值汇总
+MISSING_QUOTE = (float("nan"), float("nan"), float("nan"), "未找到", "-", False)
+
+
+class MarketDataError(Exception):
+    """行情服务请求失败（网络错误 / 服务端错误，已按策略重试）"""
+
+
+class CircuitOpenError(MarketDataError):
+    """该主机处于熔断期，请求未发出直接失败"""
+
+
+# ============================
+# 共享 HTTP 客户端：按主机复用连接池，有限重试 + 抖动退避，按主机熔断
+# ============================
+class CircuitBreaker:
+    """
+    连续失败计数熔断器。
+
+    closed：正常放行；连续失败达到阈值后 open：直接拒绝；
+    冷却期过后 half_open：只放行一个试探请求，成功则恢复，失败则重新计时。
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.cooldown and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """试探请求未得出结论（非网络异常中断）时释放试探位，下次调用可重新试探"""
+        with self._lock:
+            self._probing = False
+
+
+class _Host(NamedTuple):
+    session: requests.Session
+    breaker: CircuitBreaker
+
+
+_hosts: Dict[str, _Host] = {}
+_hosts_lock = threading.Lock()
+
+
+def _host(netloc: str) -> _Host:
+    host = _hosts.get(netloc)
+    if host is None:
+        with _hosts_lock:
+            host = _hosts.get(netloc)
+            if host is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                host = _hosts[netloc] = _Host(session, CircuitBreaker())
+    return host
+
+
+def breaker_states() -> Dict[str, str]:
+    """各主机熔断器状态（调试面板用）"""
+    with _hosts_lock:
+        hosts = dict(_hosts)
+    return {netloc: h.breaker.state for netloc, h in hosts.items()}
+
+
+def http_get(url: str, params: dict = None, headers: dict = None, timeout=QUOTE_TIMEOUT,
+             retries: int = HTTP_RETRIES) -> requests.Response:
+    """
+    GET 请求：复用该主机的长连接，请求异常（连接 / 超时 / 分块传输 / 重定向等）或 5xx 时退避重试。
+
+    重试用尽记一次主机失败并抛 MarketDataError；熔断期内直接抛 CircuitOpenError，不占用等待时间。
+    其余 4xx 视为正常响应返回，由调用方解析。
+    """
+    netloc = urlparse(url).netloc
+    host = _host(netloc)
+    if not host.breaker.allow():
+        incr("http.circuit_open")
+        raise CircuitOpenError(f"{netloc} 熔断中，暂停请求")
+
+    error: Exception = None
+    try:
+        for attempt in range(retries + 1):
+            if attempt:
+                incr("http.retry")
+                time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+            try:
+                r = host.session.get(url, params=params, headers=headers, timeout=timeout)
+            except requests.RequestException as e:
+                error = e
+                continue
+            if r.status_code in RETRY_STATUS:
+                error = MarketDataError(f"HTTP {r.status_code}")
+                continue
+            host.breaker.success()
+            return r
+    except BaseException:
+        # 非 requests 异常（参数错误、中断等）不计失败，但必须释放半开试探位，否则主机永远停在熔断
+        host.breaker.release()
+        raise
+
+    host.breaker.failure()
+    incr("http.failure")
+    raise MarketDataError(f"{netloc} 请求失败（重试 {retries} 次）: {error}") from error
+
+
+def fetch_quote(code) -> tuple:
+    """
+    抓取单只基金的实时估值，返回 (dwjz, gsz, gszzl, name, jzrq, ok)。
+
+    接口查无此基金（或估值字段为空）时返回 MISSING_QUOTE；网络 / 服务故障抛 MarketDataError。
+    """
+    code = str(code).zfill(6)
+    r = http_get(f"{FUNDGZ_BASE}/js/{code}.js")
+    text = r.text
+    if "jsonpgz" in text and "{" in text:
+        try:
+            data = json.loads(text[text.find('{'):text.rfind('}') + 1])
+            return (
+                float(data['dwjz']),
+                float(data['gsz']),
+                float(data['gszzl']),
+                data['name'],
+                data['jzrq'],
+                True
+            )
+        except (ValueError, KeyError):
+            pass
+    return MISSING_QUOTE
+
+
+class QuoteResult(NamedTuple):
+    """批量抓取中单只基金的结果"""
+    quote: tuple      # 与 fetch_quote 返回值相同的六元组
+    status: str       # ok / not_found / timeout / unavailable（熔断）/ error
+    elapsed: float    # 单只基金耗时（秒）
+
+
+def fetch_quotes(
+    codes: Iterable,
+    fetch: Callable = fetch_quote,
+    deadline: float = 5.0,
+    max_workers: int = 8,
+) -> Dict[str, QuoteResult]:
+    """
+    并发抓取一组基金行情。
+
+    整体耗时受 deadline 限制：到点仍未返回的基金标记为 timeout 并返回占位行情，
+    已完成的部分照常返回。fetch 可替换为带缓存的版本（如页面里的 st.cache_data 包装）。
+    """
+    # 去重并保持原有顺序
+    codes = list(dict.fromkeys(str(c).zfill(6) for c in codes))
+    if not codes:
+        return {}
+
+    def _timed(code):
+        start = time.perf_counter()
+        quote = fetch(code)
+        return quote, time.perf_counter() - start
+
+    pool = ThreadPoolExecutor(max_workers=min(max_workers, len(codes)))
+    try:
+        futures = {pool.submit(_timed, code): code for code in codes}
+        done, _ = wait(futures, timeout=deadline)
+
+        results = {}
+        for fut, code in futures.items():
+            if fut not in done:
+                results[code] = QuoteResult(MISSING_QUOTE, "timeout", deadline)
+                continue
+            try:
+                quote, elapsed = fut.result()
+            except CircuitOpenError:
+                results[code] = QuoteResult(MISSING_QUOTE, "unavailable", 0.0)
+                continue
+            except Exception:
+                results[code] = QuoteResult(MISSING_QUOTE, "error", 0.0)
+                continue
+            status = "ok" if quote[5] else "not_found"
+            results[code] = QuoteResult(quote, status, elapsed)
+        return results
+    finally:
+        # 不等待慢请求，让它们在后台自行结束
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ============================
+# 历史净值（东方财富 lsjz 接口）
+# ============================
+def fetch_nav_history(code, start_date: str, end_date: str, page_size: int = NAV_PAGE_SIZE) -> List[Tuple[str, float]]:
+    """
+    分页抓取 [start_date, end_date] 区间内的单位净值，返回 [(YYYY-MM-DD, 净值)]。
+
+    网络或解析失败抛 MarketDataError，调用方据此判断区间是否抓取完整。
+    """
+    code = str(code).zfill(6)
+    headers = {"Referer": "http://fundf10.eastmoney.com/"}
+    rows = []
+    page = 1
+    while True:
+        params = {
+            "fundCode": code,
+            "pageIndex": page,
+            "pageSize": page_size,
+            "startDate": start_date,
+            "endDate": end_date,
+            "_": int(time.time() * 1000),
+        }
+        r = http_get(f"{EASTMONEY_BASE}/f10/lsjz", params=params, headers=headers, timeout=(2, 5))
+        try:
+            payload = r.json()
+        except ValueError as e:
+            raise MarketDataError(f"历史净值接口返回格式异常: {e}") from e
+        items = (payload.get("Data") or {}).get("LSJZList") or []
+        for item in items:
+            if item.get("DWJZ"):
+                rows.append((item["FSRQ"], float(item["DWJZ"])))
+        total = int(payload.get("TotalCount") or 0)
+        if not items or page * page_size >= total:
+            return rows
+        page += 1
+
+
+# ============================
+# 全市场基金目录（天天基金 fundcode_search.js）
+# ============================
+def fetch_fund_list() -> List[list]:
+    """抓取全部基金，返回 [[代码, 拼音首字母, 名称, 类型, 全拼], ...]；失败抛异常"""
+    r = http_get(f"{FUND_LIST_BASE}/js/fundcode_search.js", timeout=(3, 10))
+    r.encoding = "utf-8"
+    text = r.text
+    return json.loads(text[text.find('['):text.rfind(']') + 1])
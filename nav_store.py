@@ -0,0 +1,140 @@
+# ============================
+# 本地历史净值库（SQLite，按 (基金代码, 日期) 存储）
+# 区间整体分页回补，已覆盖的日期不再请求网络
+# ============================
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from market_data import fetch_nav_history
+
+NAV_DB_PATH = os.environ.get("LUMILA_NAV_DB", "nav_history.sqlite3")
+
+# 最近几天的净值可能尚未公布：这些日期只有真正拿到数据后才记为已覆盖
+SETTLE_DAYS = 3
+
+# 查询交易净值时顺带回补的历史窗口（天）
+LOOKUP_WINDOW_DAYS = 90
+
+
+def _as_date(value) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+class NavStore:
+    """
+    历史净值本地缓存。
+
+    每只基金记录一段连续的已覆盖区间 coverage；backfill 只抓取请求区间中落在覆盖区间之外的部分，
+    抓取完成后把两段合并为新的覆盖区间。点查 / 区间查询只读本地库。
+    """
+
+    def __init__(self, path: str = NAV_DB_PATH, fetch: Callable = fetch_nav_history):
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "create table if not exists nav ("
+                " fund_code text not null, date text not null, dwjz real not null,"
+                " primary key (fund_code, date)) without rowid"
+            )
+            self._conn.execute(
+                "create table if not exists coverage ("
+                " fund_code text primary key, start_date text not null, end_date text not null)"
+            )
+
+    # ---------- 本地查询 ----------
+    def coverage(self, code) -> Optional[Tuple[date, date]]:
+        code = str(code).zfill(6)
+        with self._lock:
+            row = self._conn.execute(
+                "select start_date, end_date from coverage where fund_code = ?", (code,)
+            ).fetchone()
+        return (date.fromisoformat(row[0]), date.fromisoformat(row[1])) if row else None
+
+    def get_nav(self, code, day) -> Optional[float]:
+        """读取某日单位净值（非交易日或未回补返回 None）"""
+        with self._lock:
+            row = self._conn.execute(
+                "select dwjz from nav where fund_code = ? and date = ?",
+                (str(code).zfill(6), _as_date(day).isoformat())
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_range(self, code, start, end) -> List[Tuple[str, float]]:
+        """读取区间内的 [(日期, 净值)]，按日期升序"""
+        with self._lock:
+            return self._conn.execute(
+                "select date, dwjz from nav where fund_code = ? and date between ? and ? order by date",
+                (str(code).zfill(6), _as_date(start).isoformat(), _as_date(end).isoformat())
+            ).fetchall()
+
+    # ---------- 网络回补 ----------
+    def backfill(self, code, start, end) -> int:
+        """补齐 [start, end] 中尚未覆盖的部分，返回新写入的净值条数"""
+        code = str(code).zfill(6)
+        start, end = _as_date(start), _as_date(end)
+        covered = self.coverage(code)
+
+        if covered is None:
+            gaps = [(start, end)]
+        else:
+            gaps = []
+            if start < covered[0]:
+                gaps.append((start, covered[0] - timedelta(days=1)))
+            if end > covered[1]:
+                gaps.append((covered[1] + timedelta(days=1), end))
+        if not gaps:
+            return 0
+
+        rows = []
+        for gap_start, gap_end in gaps:
+            rows.extend(self._fetch(code, gap_start.isoformat(), gap_end.isoformat()))
+
+        new_start = min(start, covered[0]) if covered else start
+        new_end = max(end, covered[1]) if covered else end
+        settle_from = date.today() - timedelta(days=SETTLE_DAYS)
+        if new_end > settle_from:
+            # 尚未结算的日期只覆盖到实际拿到净值的最后一天
+            known = [_as_date(d) for d, _ in rows] + [settle_from] + ([covered[1]] if covered else [])
+            new_end = min(new_end, max(known))
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "insert or replace into nav (fund_code, date, dwjz) values (?, ?, ?)",
+                [(code, d, nav) for d, nav in rows]
+            )
+            if new_end >= new_start:
+                self._conn.execute(
+                    "insert or replace into coverage (fund_code, start_date, end_date) values (?, ?, ?)",
+                    (code, new_start.isoformat(), new_end.isoformat())
+                )
+        return len(rows)
+
+    def backfill_many(self, codes: Iterable, start, end, max_workers: int = 8) -> Dict[str, int]:
+        """并发回补多只基金；单只失败不影响其他基金（该基金返回 -1，覆盖区间保持不变）"""
+        codes = list(dict.fromkeys(str(c).zfill(6) for c in codes))
+
+        def _one(code):
+            try:
+                return self.backfill(code, start, end)
+            except Exception:
+                return -1
+
+        if not codes:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(codes))) as pool:
+            return dict(zip(codes, pool.map(_one, codes)))
+
+    def lookup(self, code, day) -> Optional[float]:
+        """交易净值查询：先查本地库，未覆盖时回补该日之前一段窗口后再查"""
+        day = _as_date(day)
+        nav = self.get_nav(code, day)
+        if nav is None:
+            self.backfill(code, day - timedelta(days=LOOKUP_WINDOW_DAYS), day)
+            nav = self.get_nav(code, day)
+        return nav
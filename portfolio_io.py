@@ -0,0 +1,101 @@
+# ============================
+# 持仓批量导入 / 导出
+# 支持 CSV / Excel / 券商导出文件：一次向量化完成列识别、代码补零、数值清洗与去重合并
+# ============================
+import io
+from typing import Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 标准列 -> 常见的别名（券商、基金平台导出文件的表头）
+COLUMN_ALIASES = {
+    "基金代码": ["基金代码", "代码", "证券代码", "产品代码", "fund_code", "code"],
+    "基金名称": ["基金名称", "名称", "证券名称", "产品名称", "基金简称", "fund_name", "name"],
+    "持有份额": ["持有份额", "份额", "持仓份额", "当前份额", "可用份额", "shares"],
+    "成本单价": ["成本单价", "成本价", "持仓成本价", "单位成本", "成本", "cost_price", "cost"],
+}
+
+EXPORT_COLUMNS = ["基金代码", "基金名称", "持有份额", "成本单价"]
+
+
+class HoldingsImportError(ValueError):
+    """导入文件无法识别（缺少必需列、格式不支持等）"""
+
+
+def read_holdings_file(data: bytes, filename: str) -> pd.DataFrame:
+    """按扩展名读取上传文件，所有列先按字符串读入，清洗交给 normalize_holdings"""
+    name = filename.lower()
+    if name.endswith((".xlsx", ".xls")):
+        try:
+            return pd.read_excel(io.BytesIO(data), dtype=str)
+        except ImportError as e:
+            raise HoldingsImportError("读取 Excel 需要安装 openpyxl（.xlsx）或 xlrd（.xls），也可另存为 CSV 后导入") from e
+    for encoding in ("utf-8-sig", "gbk"):
+        try:
+            return pd.read_csv(io.BytesIO(data), dtype=str, encoding=encoding, sep=None, engine="python")
+        except UnicodeDecodeError:
+            continue
+    raise HoldingsImportError("无法识别文件编码，请另存为 UTF-8 CSV")
+
+
+def normalize_holdings(raw: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    把任意表头的持仓表清洗为 基金代码 / 基金名称 / 持有份额 / 成本单价。
+
+    返回 (有效持仓, 被拒绝的原始行)。同一代码出现多次时份额相加、成本按份额加权。
+    """
+    columns = {str(c).strip(): c for c in raw.columns}
+    picked = {}
+    for target, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in columns:
+                picked[target] = columns[alias]
+                break
+    missing = [c for c in ("基金代码", "持有份额") if c not in picked]
+    if missing:
+        raise HoldingsImportError(f"缺少必需列: {', '.join(missing)}（可识别的表头见 COLUMN_ALIASES）")
+
+    def numeric(col):
+        if col not in picked:
+            return pd.Series(np.nan, index=raw.index)
+        text = raw[picked[col]].astype(str).str.replace(",", "", regex=False).str.strip()
+        return pd.to_numeric(text, errors='coerce')
+
+    codes = raw[picked["基金代码"]].astype(str).str.extract(r"(\d{1,6})", expand=False).str.zfill(6)
+    names = raw[picked["基金名称"]].fillna("").astype(str).str.strip() if "基金名称" in picked else ""
+    df = pd.DataFrame({
+        "基金代码": codes,
+        "基金名称": names,
+        "持有份额": numeric("持有份额"),
+        "成本单价": numeric("成本单价").fillna(0),
+    }, index=raw.index)
+
+    invalid = df["基金代码"].isna() | df["持有份额"].isna() | (df["持有份额"] < 0) | (df["成本单价"] < 0)
+    rejected = raw[invalid]
+    df = df[~invalid]
+
+    df["_成本"] = df["持有份额"] * df["成本单价"]
+    grouped = df.groupby("基金代码", sort=False).agg(
+        基金名称=("基金名称", "first"), 持有份额=("持有份额", "sum"), _成本=("_成本", "sum")
+    ).reset_index()
+    grouped["成本单价"] = np.where(grouped["持有份额"] > 0, grouped["_成本"] / grouped["持有份额"].where(grouped["持有份额"] > 0, 1), 0.0)
+    return grouped[EXPORT_COLUMNS], rejected
+
+
+def split_new_holdings(existing: pd.DataFrame, incoming: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    把导入的持仓拆成 (未持有的新基金, 已持有的基金)。
+
+    已持有基金的份额与成本只能经交易流水变更（见 ledger.py），导入只新增未持有的基金。
+    """
+    held = incoming["基金代码"].isin(existing["基金代码"].astype(str).str.zfill(6))
+    return incoming[~held].reset_index(drop=True), incoming[held].reset_index(drop=True)
+
+
+def export_holdings_csv(df: pd.DataFrame, chunk_rows: int = 500) -> Iterator[bytes]:
+    """分块编码 CSV（带 BOM，Excel 可直接打开）"""
+    out = df.reindex(columns=EXPORT_COLUMNS)
+    yield "﻿".encode("utf-8") + out.head(0).to_csv(index=False).encode("utf-8")
+    for start in range(0, len(out), chunk_rows):
+        yield out.iloc[start:start + chunk_rows].to_csv(index=False, header=False).encode("utf-8")
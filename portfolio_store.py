@@ -0,0 +1,170 @@
+# ============================
+# 持仓持久化（Supabase portfolios 表）
+# 与 Streamlit 无关：出错时抛异常，由页面决定如何提示
+# ============================
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 全部账户（页面的账户切换、定时快照任务共用）
+ACCOUNTS = ["噜噜", "咪咪"]
+
+# 页面使用的列
+# 版本 = 行级乐观锁版本号（新行为空）；已实现收益 / 账本序号 由交易账本维护（见 ledger.py）
+PORTFOLIO_COLUMNS = ["基金代码", "基金名称", "持有份额", "成本单价", "版本", "已实现收益", "账本序号"]
+
+DB_TO_DF = {
+    "fund_code": "基金代码",
+    "fund_name": "基金名称",
+    "shares": "持有份额",
+    "cost_price": "成本单价",
+    "version": "版本",
+    "realized_pnl": "已实现收益",
+    "ledger_seq": "账本序号",
+}
+
+
+class PortfolioConflict(Exception):
+    """持仓已被其他会话修改（版本号不一致），需要重新加载后再提交"""
+
+
+def empty_portfolio() -> pd.DataFrame:
+    return pd.DataFrame(columns=PORTFOLIO_COLUMNS)
+
+
+def _to_frame(rows: List[dict], columns: List[str]) -> pd.DataFrame:
+    df = pd.DataFrame(rows).rename(columns=DB_TO_DF)
+    df = df.reindex(columns=columns).copy()
+    df["基金代码"] = df["基金代码"].astype(str).str.zfill(6)
+    for col in ["持有份额", "成本单价", "已实现收益", "账本序号"]:
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    df["账本序号"] = df["账本序号"].astype(int)
+    return df
+
+
+def fetch_portfolio(client, username: str) -> pd.DataFrame:
+    """读取用户持仓，列名转换为页面使用的中文列"""
+    response = client.table("portfolios").select("*").eq("username", username).execute()
+    if not response.data:
+        return empty_portfolio()
+    return _to_frame(response.data, PORTFOLIO_COLUMNS)
+
+
+def fetch_portfolios(client, usernames: Iterable[str]) -> pd.DataFrame:
+    """一次查询读取多个账户的持仓，在最前面附加 账户 列（同一基金在不同账户各占一行）"""
+    usernames = list(usernames)
+    columns = ["账户"] + PORTFOLIO_COLUMNS
+    response = client.table("portfolios").select("*").in_("username", usernames).execute()
+    if not response.data:
+        return pd.DataFrame(columns=columns)
+    df = _to_frame([dict(r, 账户=r.get("username")) for r in response.data], columns)
+    # 按账户列表的顺序排列，便于逐账户展示
+    order = {u: i for i, u in enumerate(usernames)}
+    return df.sort_values("账户", key=lambda s: s.map(order), kind="stable").reset_index(drop=True)
+
+
+def fetch_portfolio_version(client, username: str) -> int:
+    """读取用户持仓的版本号（portfolio_heads 表，任意写入都会递增），从未写入过为 0"""
+    response = client.table("portfolio_heads").select("version").eq("username", username).execute()
+    return int(response.data[0]["version"]) if response.data else 0
+
+
+def fetch_portfolio_versions(client, usernames: Iterable[str]) -> Dict[str, int]:
+    """一次查询读取多个账户的持仓版本号，从未写入过的账户为 0"""
+    usernames = list(usernames)
+    response = client.table("portfolio_heads").select("username,version").in_("username", usernames).execute()
+    versions = {r["username"]: int(r["version"]) for r in response.data or []}
+    return {u: versions.get(u, 0) for u in usernames}
+
+
+def fetch_closed_realized(client, usernames: Iterable[str]) -> Dict[str, float]:
+    """各账户已移除持仓行累积的已实现收益（portfolio_heads.closed_realized，见 sql/006_position_lifecycle.sql），没有记录为 0"""
+    usernames = list(usernames)
+    response = client.table("portfolio_heads").select("username,closed_realized").in_("username", usernames).execute()
+    closed = {r["username"]: float(r["closed_realized"] or 0) for r in response.data or []}
+    return {u: closed.get(u, 0.0) for u in usernames}
+
+
+def diff_portfolio(base: pd.DataFrame, new: pd.DataFrame) -> Tuple[List[dict], List[dict]]:
+    """
+    以 基金代码 为键比较两份持仓，返回 (upserts, deletes)。
+
+    upserts 中 version 为空表示新增，否则为期望的旧版本号（用于乐观锁）；
+    deletes 只携带 fund_code 与期望版本号。未变化的行不会出现在结果里。
+    new 中同一基金代码只能出现一次：重复行无法判断是覆盖还是加仓，直接抛 ValueError。
+    """
+    base = base.reindex(columns=PORTFOLIO_COLUMNS).copy()
+    new = new.reindex(columns=PORTFOLIO_COLUMNS).copy()
+    for df in (base, new):
+        df["基金代码"] = df["基金代码"].astype(str).str.zfill(6)
+        df["持有份额"] = pd.to_numeric(df["持有份额"], errors='coerce').fillna(0.0)
+        df["成本单价"] = pd.to_numeric(df["成本单价"], errors='coerce').fillna(0.0)
+    dup = new["基金代码"][new["基金代码"].duplicated()].unique()
+    if len(dup):
+        raise ValueError(f"持仓中基金代码重复: {', '.join(dup)}")
+    base = base.drop_duplicates("基金代码", keep="last")
+    new = new.drop(columns="版本")
+
+    merged = base.merge(new, on="基金代码", how="outer", suffixes=("_旧", ""), indicator=True)
+    inserted = merged["_merge"] == "right_only"
+    deleted = merged["_merge"] == "left_only"
+    both = merged["_merge"] == "both"
+    changed = both & (
+        (merged["基金名称"].astype(str) != merged["基金名称_旧"].astype(str))
+        | ~np.isclose(merged["持有份额"], merged["持有份额_旧"], rtol=0, atol=1e-9)
+        | ~np.isclose(merged["成本单价"], merged["成本单价_旧"], rtol=0, atol=1e-9)
+    )
+
+    upserts = []
+    for _, row in merged[inserted | changed].iterrows():
+        version = row["版本"]
+        upserts.append({
+            "fund_code": row["基金代码"],
+            "fund_name": str(row["基金名称"]),
+            "shares": float(row["持有份额"]),
+            "cost_price": float(row["成本单价"]),
+            "version": None if pd.isna(version) else int(version),
+        })
+    deletes = [
+        {"fund_code": row["基金代码"], "version": None if pd.isna(row["版本"]) else int(row["版本"])}
+        for _, row in merged[deleted].iterrows()
+    ]
+    return upserts, deletes
+
+
+def apply_portfolio_changes(client, username: str, base: pd.DataFrame, new: pd.DataFrame,
+                            chunk_size: int = 0) -> int:
+    """
+    只把 base → new 之间的差异写回云端，整批变更在一次 RPC（单个数据库事务）内完成。
+
+    返回变更行数；若任一行的版本号与云端不一致，整批回滚并抛出 PortfolioConflict。
+    chunk_size > 0 时（批量导入）每 chunk_size 行一次 RPC，请求数为 ceil(变更行数 / chunk_size)；
+    此时只有出错的那一批回滚，之前的批次已经提交，调用方应重新加载后再决定是否重试。
+    """
+    upserts, deletes = diff_portfolio(base, new)
+    if not upserts and not deletes:
+        return 0
+    if chunk_size <= 0:
+        return _apply_chunk(client, username, upserts, deletes)
+
+    changed = 0
+    for start in range(0, len(deletes), chunk_size):
+        changed += _apply_chunk(client, username, [], deletes[start:start + chunk_size])
+    for start in range(0, len(upserts), chunk_size):
+        changed += _apply_chunk(client, username, upserts[start:start + chunk_size], [])
+    return changed
+
+
+def _apply_chunk(client, username: str, upserts: List[dict], deletes: List[dict]) -> int:
+    try:
+        response = client.rpc("apply_portfolio_changes", {
+            "p_username": username,
+            "p_upserts": upserts,
+            "p_deletes": deletes,
+        }).execute()
+    except Exception as e:
+        if "portfolio_conflict" in str(e):
+            raise PortfolioConflict(str(e)) from e
+        raise
+    return int(response.data[0]["changed_rows"]) if response.data else 0
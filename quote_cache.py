@@ -0,0 +1,161 @@
+# ============================
+# 进程内共享的实时行情缓存
+# 所有会话共用一份；后台线程定时刷新正在持有的基金，过期数据先返回、后台再更新
+# ============================
+import threading
+import time
+from datetime import datetime, time as dtime
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from market_data import MISSING_QUOTE, QuoteResult, fetch_quote, fetch_quotes
+from tracing import incr, span
+
+MARKET_TZ = ZoneInfo("Asia/Shanghai")
+
+# A 股交易时段（估值只在这些时间变化）
+TRADING_SESSIONS = [(dtime(9, 30), dtime(11, 30)), (dtime(13, 0), dtime(15, 0))]
+
+
+def is_trading_time(now: Optional[datetime] = None) -> bool:
+    now = now or datetime.now(MARKET_TZ)
+    if now.weekday() >= 5:
+        return False
+    t = now.time()
+    return any(start <= t <= end for start, end in TRADING_SESSIONS)
+
+
+class QuoteCache:
+    """
+    行情缓存服务。
+
+    - get_many：命中即返回（过期也先返回，同时唤醒后台刷新），只有从未抓过的代码才同步抓取
+    - track：登记正在被查看的持仓代码，后台线程只轮询最近 track_ttl 秒内登记过的代码
+    - refresh / invalidate：按代码定向刷新或失效，不影响其他缓存
+    """
+
+    def __init__(
+        self,
+        fetch: Callable = fetch_quote,
+        ttl: float = 60,
+        refresh_interval: float = 30,
+        idle_interval: float = 600,
+        track_ttl: float = 1800,
+        deadline: float = 5.0,
+        ticks=None,
+    ):
+        self._fetch = fetch
+        # 可选的分时记录器（tick_buffer.TickBuffer），交易时段内每次抓到的有效行情都会写入
+        self._ticks = ticks
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.idle_interval = idle_interval
+        self.track_ttl = track_ttl
+        self.deadline = deadline
+
+        self._entries: Dict[str, Tuple[tuple, float]] = {}   # 代码 -> (行情, 抓取时间)
+        self._tracked: Dict[str, float] = {}                 # 代码 -> 最近登记时间
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    # ---------- 后台刷新 ----------
+    def start(self):
+        """启动后台刷新线程（重复调用无副作用）"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="quote-cache-refresher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            interval = self.refresh_interval if is_trading_time() else self.idle_interval
+            self._wake.wait(timeout=interval)
+            self._wake.clear()
+            try:
+                self._refresh_stale()
+            except Exception:
+                # 后台线程不能因单次失败退出
+                pass
+
+    def _refresh_stale(self):
+        now = time.time()
+        with self._lock:
+            for code in [c for c, seen in self._tracked.items() if now - seen > self.track_ttl]:
+                del self._tracked[code]
+            max_age = self.refresh_interval if is_trading_time() else self.ttl
+            stale = [
+                c for c in set(self._tracked) | {c for c, (_, at) in self._entries.items() if at == 0}
+                if now - self._entries.get(c, (None, 0))[1] >= max_age
+            ]
+        if stale:
+            with span("quotes.background_refresh", funds=len(stale)):
+                self._store(fetch_quotes(stale, fetch=self._fetch, deadline=self.deadline))
+
+    def _store(self, results: Dict[str, QuoteResult]):
+        now = time.time()
+        with self._lock:
+            for code, res in results.items():
+                # 超时 / 熔断 / 故障不覆盖已有行情
+                if res.status not in ("ok", "not_found"):
+                    continue
+                old = self._entries.get(code)
+                # 偶发查不到时保留上一份有效行情
+                if res.status == "not_found" and old and old[0][5]:
+                    continue
+                self._entries[code] = (res.quote, now)
+        if self._ticks is not None and is_trading_time():
+            self._ticks.record_many({c: r.quote for c, r in results.items() if r.status == "ok"}, now)
+
+    # ---------- 查询 ----------
+    def track(self, codes: Iterable):
+        now = time.time()
+        with self._lock:
+            for code in codes:
+                self._tracked[str(code).zfill(6)] = now
+
+    def get_many(self, codes: Iterable) -> Dict[str, QuoteResult]:
+        codes = list(dict.fromkeys(str(c).zfill(6) for c in codes))
+        now = time.time()
+        results, missing, stale = {}, [], 0
+        with self._lock:
+            for code in codes:
+                entry = self._entries.get(code)
+                if entry is None:
+                    missing.append(code)
+                    continue
+                quote, fetched_at = entry
+                stale += now - fetched_at >= self.ttl
+                results[code] = QuoteResult(quote, "ok" if quote[5] else "not_found", 0.0)
+        incr("quote_cache.hit", len(results) - stale)
+        incr("quote_cache.stale", stale)
+        incr("quote_cache.miss", len(missing))
+        if stale:
+            self._wake.set()
+        if missing:
+            with span("quotes.fetch", funds=len(missing)):
+                fetched = fetch_quotes(missing, fetch=self._fetch, deadline=self.deadline)
+            self._store(fetched)
+            results.update(fetched)
+        return {code: results[code] for code in codes}
+
+    def get(self, code) -> tuple:
+        """单只基金行情六元组（与 fetch_quote 相同）"""
+        code = str(code).zfill(6)
+        return self.get_many([code]).get(code, QuoteResult(MISSING_QUOTE, "error", 0.0)).quote
+
+    def refresh(self, codes: Iterable) -> Dict[str, QuoteResult]:
+        """立即同步刷新指定代码"""
+        with span("quotes.refresh"):
+            results = fetch_quotes(codes, fetch=self._fetch, deadline=self.deadline)
+        self._store(results)
+        return results
+
+    def invalidate(self, codes: Iterable):
+        """把指定代码标记为过期，由后台线程尽快重新抓取"""
+        with self._lock:
+            for code in codes:
+                code = str(code).zfill(6)
+                if code in self._entries:
+                    self._entries[code] = (self._entries[code][0], 0)
+        self._wake.set()
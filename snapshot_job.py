@@ -0,0 +1,91 @@
+# ============================
+# 定时估值任务（无需 Streamlit）
+# 一次查询加载全部账户持仓 → 去重后并发抓取行情 → 一次估值 → 按账户写入 snapshots 表
+#
+#   python snapshot_job.py                      # 盘中按 15 分钟取整记一个槽位，15:00 之后记为收盘快照，开盘前跳过
+#   python snapshot_job.py --slot close --dry-run
+#
+# crontab 示例（服务器时区为 Asia/Shanghai）：
+#   */15 9-14 * * 1-5  cd /srv/lumila && python snapshot_job.py    # 9:30 前跳过，午间休市归入 11:30
+#   5 15 * * 1-5       cd /srv/lumila && python snapshot_job.py    # 收盘快照
+#   30 22 * * 1-5      cd /srv/lumila && python snapshot_job.py    # 晚间净值更新后覆盖当日收盘快照
+# ============================
+import argparse
+import os
+import sys
+from datetime import datetime
+from typing import Optional
+
+from market_data import fetch_quotes
+from portfolio_store import ACCOUNTS, fetch_closed_realized, fetch_portfolio_versions, fetch_portfolios
+from quote_cache import MARKET_TZ
+from snapshots import build_snapshots, snapshot_slot, write_snapshots
+from valuation import quotes_to_frame, value_portfolio
+
+
+def run(client, usernames, slot: str = None, slot_minutes: int = 15, deadline: float = 20.0,
+        dry_run: bool = False) -> Optional[list]:
+    """
+    为 usernames 生成并写入一次快照，返回写入（或 dry_run 时将要写入）的快照行。
+
+    未指定 slot 且当前不属于任何槽位（开盘前 / 周末）时不抓取行情，返回 None。
+    """
+    now = datetime.now(MARKET_TZ)
+    if slot:
+        snap_date = now.date()
+    else:
+        auto = snapshot_slot(now, slot_minutes)
+        if auto is None:
+            return None
+        snap_date, slot = auto
+
+    versions = fetch_portfolio_versions(client, usernames)
+    holdings = fetch_portfolios(client, usernames)
+    closed = fetch_closed_realized(client, usernames)
+    results = fetch_quotes(holdings["基金代码"].tolist(), deadline=deadline)
+    quotes_df = quotes_to_frame({c: res.quote for c, res in results.items()})
+    funds, _ = value_portfolio(holdings, quotes_df, keep=["账户", "持有份额"])
+
+    rows = build_snapshots(funds, holdings, quotes_df, versions, now, snap_date, slot, closed)
+    if not dry_run:
+        write_snapshots(client, rows)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="噜咪啦定时估值快照")
+    parser.add_argument("--users", nargs="+", default=ACCOUNTS, help="要估值的账户（默认全部）")
+    parser.add_argument("--slot", help="强制指定槽位，如 close 或 14:30（默认按当前时间推断）")
+    parser.add_argument("--slot-minutes", type=int, default=15, help="盘中槽位的取整间隔（分钟）")
+    parser.add_argument("--deadline", type=float, default=20.0, help="行情抓取的总超时（秒）")
+    parser.add_argument("--dry-run", action="store_true", help="只计算并打印，不写入数据库")
+    args = parser.parse_args(argv)
+
+    url = os.environ.get("SUPABASE_URL", "")
+    key = os.environ.get("SUPABASE_KEY", "")
+    if not url or not key:
+        print("❌ 未配置 SUPABASE_URL / SUPABASE_KEY", file=sys.stderr)
+        return 2
+
+    from supabase import create_client
+    client = create_client(url, key)
+    try:
+        rows = run(client, args.users, args.slot, args.slot_minutes, args.deadline, args.dry_run)
+    except Exception as e:
+        print(f"❌ 快照失败: {e}", file=sys.stderr)
+        return 1
+
+    if rows is None:
+        print("⏭️ 开盘前 / 非交易日，跳过本次快照")
+        return 0
+    for r in rows:
+        line = (f"{r['username']} {r['snap_date']} {r['slot']}: 资产 {r['total_v']:,.2f} "
+                f"当日 {r['total_d']:+,.2f} 累计 {r['total_h'] + r['realized']:+,.2f} ({len(r['funds'])} 只)")
+        if r["missing"]:
+            line += f"，{r['missing']} 只行情缺失"
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
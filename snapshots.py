@@ -0,0 +1,124 @@
+# ============================
+# 估值快照（Supabase snapshots 表，见 sql/004_snapshots.sql）
+# 由 snapshot_job.py 定时写入；页面可直接展示最新快照，或读取每日收盘快照画走势
+# 与 Streamlit 无关：出错时抛异常，由调用方决定如何提示
+# ============================
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from quote_cache import MARKET_TZ, TRADING_SESSIONS, is_trading_time
+
+# 快照中逐基金记录的字段（funds 列存为二维数组，按此顺序）
+SNAPSHOT_FIELDS = ["代码", "基金名称", "持有份额", "持有金额", "涨幅", "当日收益", "累计收益", "收益率"]
+
+# 收盘后的快照槽位；盘中快照的槽位为 "HH:MM"
+CLOSE_SLOT = "close"
+
+MARKET_OPEN = TRADING_SESSIONS[0][0]
+MORNING_CLOSE = TRADING_SESSIONS[0][1]
+MARKET_CLOSE = TRADING_SESSIONS[-1][1]
+
+# 历史走势只取这些列，不拉取逐基金明细
+HISTORY_COLUMNS = "username,snap_date,slot,total_v,total_d,total_h,realized"
+
+
+def snapshot_slot(now: Optional[datetime] = None, slot_minutes: int = 15) -> Optional[Tuple[date, str]]:
+    """
+    快照归属的 (日期, 槽位)：盘中按 slot_minutes 取整，午间休市归入上午收盘的槽位，
+    工作日 15:00 之后记为当日收盘；开盘前与周末没有新估值，返回 None（跳过）。
+
+    同一槽位重复运行会覆盖之前的快照，定时任务重试不会产生重复行。
+    """
+    now = now or datetime.now(MARKET_TZ)
+    t = now.time()
+    if now.weekday() >= 5 or t < MARKET_OPEN:
+        return None
+    if t > MARKET_CLOSE:
+        return now.date(), CLOSE_SLOT
+    if not is_trading_time(now):
+        t = MORNING_CLOSE
+    minute = t.hour * 60 + t.minute
+    minute -= minute % slot_minutes
+    return now.date(), f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def _clean(value):
+    """JSON 不支持 NaN：缺失值写为 null，浮点保留 4 位"""
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else round(float(value), 4)
+    return value
+
+
+def build_snapshots(funds: pd.DataFrame, holdings: pd.DataFrame, quotes: pd.DataFrame,
+                    versions: Dict[str, int], taken_at: datetime, snap_date: date, slot: str,
+                    closed_realized: Optional[Dict[str, float]] = None) -> List[dict]:
+    """
+    把一次估值的结果按账户拆成快照行。
+
+    funds 为 value_portfolio(holdings, quotes, keep=["账户", "持有份额"]) 的逐基金表；
+    holdings 提供已实现收益（含已清仓基金），closed_realized 为已移除持仓行的已实现收益；
+    quotes 的 ok 列用于统计行情缺失的基金数。
+    """
+    closed_realized = closed_realized or {}
+    ok = quotes["ok"].reindex(funds["代码"]).eq(True).to_numpy()
+    funds = funds.assign(_缺失=~ok)
+    realized = pd.to_numeric(holdings["已实现收益"], errors='coerce').fillna(0).groupby(holdings["账户"]).sum()
+
+    rows = []
+    for username in versions:
+        part = funds[funds["账户"] == username]
+        rows.append({
+            "username": username,
+            "snap_date": snap_date.isoformat(),
+            "slot": slot,
+            "taken_at": taken_at.isoformat(),
+            "portfolio_version": int(versions[username]),
+            "total_v": round(float(np.nansum(part["持有金额"])), 2),
+            "total_d": round(float(np.nansum(part["当日收益"])), 2),
+            "total_h": round(float(np.nansum(part["累计收益"])), 2),
+            "realized": round(float(realized.get(username, 0.0)) + closed_realized.get(username, 0.0), 2),
+            "missing": int(part["_缺失"].sum()),
+            "funds": [[_clean(v) for v in rec] for rec in part[SNAPSHOT_FIELDS].itertuples(index=False)],
+        })
+    return rows
+
+
+def write_snapshots(client, rows: List[dict]) -> int:
+    """一次请求写入全部账户的快照（同一 账户 / 日期 / 槽位 已存在时覆盖）"""
+    if not rows:
+        return 0
+    client.table("snapshots").upsert(rows, on_conflict="username,snap_date,slot").execute()
+    return len(rows)
+
+
+def fetch_latest_snapshots(client, usernames: Iterable[str]) -> Dict[str, dict]:
+    """各账户最新的一条快照（latest_snapshots 视图），没有快照的账户不出现在结果中"""
+    response = client.table("latest_snapshots").select("*").in_("username", list(usernames)).execute()
+    return {r["username"]: r for r in response.data or []}
+
+
+def snapshot_funds(snapshot: dict) -> pd.DataFrame:
+    """把快照中的逐基金记录还原为与 value_portfolio 一致的列（占比按快照内总额重算）"""
+    df = pd.DataFrame(snapshot.get("funds") or [], columns=SNAPSHOT_FIELDS)
+    for col in SNAPSHOT_FIELDS[2:]:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    total = df["持有金额"].sum()
+    df.insert(2, "占比", df["持有金额"] / total * 100 if total > 0 else 0.0)
+    return df
+
+
+def fetch_snapshot_history(client, usernames: Iterable[str], start: date) -> pd.DataFrame:
+    """start 之后各账户的每日收盘快照汇总（不含逐基金明细），按日期升序"""
+    response = (
+        client.table("snapshots").select(HISTORY_COLUMNS)
+        .in_("username", list(usernames)).eq("slot", CLOSE_SLOT).gte("snap_date", start.isoformat())
+        .order("snap_date").execute()
+    )
+    df = pd.DataFrame(response.data or [], columns=HISTORY_COLUMNS.split(","))
+    df["snap_date"] = pd.to_datetime(df["snap_date"])
+    for col in ("total_v", "total_d", "total_h", "realized"):
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    return df
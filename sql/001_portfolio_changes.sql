@@ -0,0 +1,61 @@
+-- ============================
+-- 持仓增量写入：行级版本号 + 单事务 RPC
+-- 在 Supabase SQL Editor 中执行一次即可
+-- ============================
+
+alter table portfolios add column if not exists version integer not null default 1;
+alter table portfolios add column if not exists updated_at timestamptz not null default now();
+create unique index if not exists portfolios_username_fund_code_key on portfolios (username, fund_code);
+
+-- p_upserts: [{fund_code, fund_name, shares, cost_price, version}]，version 为 null 表示新增
+-- p_deletes: [{fund_code, version}]
+-- 任一行版本号不匹配即抛出 portfolio_conflict，整批回滚；返回单行 changed_rows
+drop function if exists apply_portfolio_changes(text, jsonb, jsonb);
+create or replace function apply_portfolio_changes(p_username text, p_upserts jsonb, p_deletes jsonb)
+returns table (changed_rows integer)
+language plpgsql
+as $$
+declare
+    r jsonb;
+    n integer;
+begin
+    changed_rows := 0;
+    for r in select * from jsonb_array_elements(coalesce(p_deletes, '[]'::jsonb)) loop
+        delete from portfolios
+        where username = p_username
+          and fund_code = r->>'fund_code'
+          and (jsonb_typeof(r->'version') is distinct from 'number' or version = (r->>'version')::integer);
+        get diagnostics n = row_count;
+        if n = 0 then
+            raise exception 'portfolio_conflict: %', r->>'fund_code';
+        end if;
+        changed_rows := changed_rows + n;
+    end loop;
+
+    for r in select * from jsonb_array_elements(coalesce(p_upserts, '[]'::jsonb)) loop
+        if jsonb_typeof(r->'version') is distinct from 'number' then
+            insert into portfolios (username, fund_code, fund_name, shares, cost_price)
+            values (p_username, r->>'fund_code', r->>'fund_name',
+                    (r->>'shares')::numeric, (r->>'cost_price')::numeric)
+            on conflict (username, fund_code) do nothing;
+        else
+            update portfolios
+            set fund_name = r->>'fund_name',
+                shares = (r->>'shares')::numeric,
+                cost_price = (r->>'cost_price')::numeric,
+                version = version + 1,
+                updated_at = now()
+            where username = p_username
+              and fund_code = r->>'fund_code'
+              and version = (r->>'version')::integer;
+        end if;
+        get diagnostics n = row_count;
+        if n = 0 then
+            raise exception 'portfolio_conflict: %', r->>'fund_code';
+        end if;
+        changed_rows := changed_rows + n;
+    end loop;
+
+    return next;
+end;
+$$;
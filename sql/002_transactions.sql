@@ -0,0 +1,51 @@
+-- ============================
+-- 交易流水账本：每笔买入/卖出追加一行，portfolios 行作为物化聚合（检查点）
+-- 依赖 001_portfolio_changes.sql
+-- ============================
+
+alter table portfolios add column if not exists realized_pnl numeric not null default 0;
+alter table portfolios add column if not exists ledger_seq bigint not null default 0;
+
+create table if not exists transactions (
+    id          bigint generated always as identity primary key,
+    username    text not null,
+    fund_code   text not null,
+    trade_date  date not null,
+    side        text not null check (side in ('buy', 'sell')),
+    amount      numeric not null,
+    nav         numeric not null,
+    shares      numeric not null,
+    created_at  timestamptz not null default now()
+);
+create index if not exists transactions_username_fund_code_id on transactions (username, fund_code, id);
+
+-- 追加流水并更新聚合持仓（客户端已按 ledger.apply_trade 算好新聚合），返回单行 trade_id
+-- p_position.version 与当前行不一致时抛出 portfolio_conflict，流水一并回滚
+drop function if exists record_trade(text, jsonb, jsonb);
+create or replace function record_trade(p_username text, p_trade jsonb, p_position jsonb)
+returns table (trade_id bigint)
+language plpgsql
+as $$
+begin
+    insert into transactions (username, fund_code, trade_date, side, amount, nav, shares)
+    values (p_username, p_trade->>'fund_code', (p_trade->>'trade_date')::date, p_trade->>'side',
+            (p_trade->>'amount')::numeric, (p_trade->>'nav')::numeric, (p_trade->>'shares')::numeric)
+    returning id into trade_id;
+
+    update portfolios
+    set shares = (p_position->>'shares')::numeric,
+        cost_price = (p_position->>'cost_price')::numeric,
+        realized_pnl = (p_position->>'realized_pnl')::numeric,
+        ledger_seq = trade_id,
+        version = version + 1,
+        updated_at = now()
+    where username = p_username
+      and fund_code = p_trade->>'fund_code'
+      and version = (p_position->>'version')::integer;
+    if not found then
+        raise exception 'portfolio_conflict: %', p_trade->>'fund_code';
+    end if;
+
+    return next;
+end;
+$$;
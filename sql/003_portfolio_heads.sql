@@ -0,0 +1,28 @@
+-- ============================
+-- 持仓版本号：每个用户一行，portfolios 任意增删改都会让 version + 1
+-- 页面每次重跑只查这一行，版本未变时直接使用会话内缓存的持仓
+-- ============================
+
+create table if not exists portfolio_heads (
+    username    text primary key,
+    version     bigint not null default 0,
+    updated_at  timestamptz not null default now()
+);
+
+create or replace function bump_portfolio_head()
+returns trigger
+language plpgsql
+as $$
+begin
+    insert into portfolio_heads as h (username, version, updated_at)
+    values (coalesce(new.username, old.username), 1, now())
+    on conflict (username) do update
+    set version = h.version + 1, updated_at = now();
+    return null;
+end;
+$$;
+
+drop trigger if exists portfolios_bump_head on portfolios;
+create trigger portfolios_bump_head
+after insert or update or delete on portfolios
+for each row execute function bump_portfolio_head();
@@ -0,0 +1,29 @@
+-- ============================
+-- 估值快照：snapshot_job.py 定时写入，每个账户每个槽位一行
+-- slot = 'close'（收盘后）或 'HH:MM'（盘中，按任务间隔取整）；同一槽位重复写入时覆盖
+-- funds 为逐基金记录的二维数组：[代码, 名称, 份额, 持有金额, 涨幅, 当日收益, 累计收益, 收益率]
+-- ============================
+
+create table if not exists snapshots (
+    id                 bigint generated always as identity primary key,
+    username           text not null,
+    snap_date          date not null,
+    slot               text not null,
+    taken_at           timestamptz not null default now(),
+    portfolio_version  bigint not null default 0,
+    total_v            double precision not null default 0,
+    total_d            double precision not null default 0,
+    total_h            double precision not null default 0,
+    realized           double precision not null default 0,
+    missing            integer not null default 0,
+    funds              jsonb not null default '[]'::jsonb,
+    unique (username, snap_date, slot)
+);
+
+create index if not exists snapshots_username_taken_at on snapshots (username, taken_at desc);
+
+-- 页面展示用：每个账户最新的一条快照
+create or replace view latest_snapshots as
+select distinct on (username) *
+from snapshots
+order by username, taken_at desc;
@@ -0,0 +1,32 @@
+-- ============================
+-- 按账本修复持仓聚合：持仓行的 ledger_seq 落后于 transactions 时，
+-- 客户端从检查点重放（ledger.replay）后用此函数写回，返回单行 new_version
+-- 依赖 002_transactions.sql
+-- ============================
+
+drop function if exists repair_position(text, text, jsonb);
+create or replace function repair_position(p_username text, p_fund_code text, p_position jsonb)
+returns table (new_version bigint)
+language plpgsql
+as $$
+begin
+    update portfolios p
+    set shares = (p_position->>'shares')::numeric,
+        cost_price = (p_position->>'cost_price')::numeric,
+        realized_pnl = (p_position->>'realized_pnl')::numeric,
+        ledger_seq = (p_position->>'seq')::bigint,
+        version = p.version + 1,
+        updated_at = now()
+    where p.username = p_username
+      and p.fund_code = p_fund_code
+      and p.version = (p_position->>'version')::bigint
+      and p.ledger_seq < (p_position->>'seq')::bigint
+    returning p.version into new_version;
+
+    if not found then
+        raise exception 'portfolio_conflict: %', p_fund_code;
+    end if;
+
+    return next;
+end;
+$$;
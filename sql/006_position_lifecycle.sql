@@ -0,0 +1,68 @@
+-- ============================
+-- 持仓生命周期与账本对齐（替换 001 中的 apply_portfolio_changes）
+-- 依赖 002_transactions.sql、003_portfolio_heads.sql
+-- 新增行的 ledger_seq 取该基金现有流水的最大 id：移除后重新加入的持仓不会重放上一段持有期的流水
+-- 移除行时该行的已实现收益转入 portfolio_heads.closed_realized，累计盈亏不因移除记录而丢失
+-- ============================
+
+alter table portfolio_heads add column if not exists closed_realized numeric not null default 0;
+
+drop function if exists apply_portfolio_changes(text, jsonb, jsonb);
+create or replace function apply_portfolio_changes(p_username text, p_upserts jsonb, p_deletes jsonb)
+returns table (changed_rows integer)
+language plpgsql
+as $$
+declare
+    r jsonb;
+    n integer;
+    v_realized numeric;
+begin
+    changed_rows := 0;
+    for r in select * from jsonb_array_elements(coalesce(p_deletes, '[]'::jsonb)) loop
+        delete from portfolios
+        where username = p_username
+          and fund_code = r->>'fund_code'
+          and (jsonb_typeof(r->'version') is distinct from 'number' or version = (r->>'version')::integer)
+        returning realized_pnl into v_realized;
+        get diagnostics n = row_count;
+        if n = 0 then
+            raise exception 'portfolio_conflict: %', r->>'fund_code';
+        end if;
+        if v_realized <> 0 then
+            insert into portfolio_heads as h (username, closed_realized)
+            values (p_username, v_realized)
+            on conflict (username) do update
+            set closed_realized = h.closed_realized + excluded.closed_realized;
+        end if;
+        changed_rows := changed_rows + n;
+    end loop;
+
+    for r in select * from jsonb_array_elements(coalesce(p_upserts, '[]'::jsonb)) loop
+        if jsonb_typeof(r->'version') is distinct from 'number' then
+            insert into portfolios (username, fund_code, fund_name, shares, cost_price, ledger_seq)
+            values (p_username, r->>'fund_code', r->>'fund_name',
+                    (r->>'shares')::numeric, (r->>'cost_price')::numeric,
+                    (select coalesce(max(t.id), 0) from transactions t
+                     where t.username = p_username and t.fund_code = r->>'fund_code'))
+            on conflict (username, fund_code) do nothing;
+        else
+            update portfolios
+            set fund_name = r->>'fund_name',
+                shares = (r->>'shares')::numeric,
+                cost_price = (r->>'cost_price')::numeric,
+                version = version + 1,
+                updated_at = now()
+            where username = p_username
+              and fund_code = r->>'fund_code'
+              and version = (r->>'version')::integer;
+        end if;
+        get diagnostics n = row_count;
+        if n = 0 then
+            raise exception 'portfolio_conflict: %', r->>'fund_code';
+        end if;
+        changed_rows := changed_rows + n;
+    end loop;
+
+    return next;
+end;
+$$;
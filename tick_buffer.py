@@ -0,0 +1,123 @@
+# ============================
+# 盘中估值分时记录
+# 每只基金一段定长环形缓冲（时间戳 / 估值 / 涨幅），内存上限固定：基金数 × capacity × 16 字节
+# 由 QuoteCache 在每次抓到新行情时写入，页面读取后画分时走势
+# ============================
+import threading
+from datetime import datetime
+from typing import Dict, Iterable
+
+import numpy as np
+import pandas as pd
+
+from quote_cache import MARKET_TZ
+
+# 每只基金保留的点数：30 秒一次刷新、4 小时交易时段约 480 个点
+TICK_CAPACITY = 512
+# 同时记录的基金数上限，超过时复用最久未更新的槽位
+MAX_FUNDS = 256
+
+
+def _market_day(ts: float) -> int:
+    return datetime.fromtimestamp(ts, MARKET_TZ).date().toordinal()
+
+
+class TickBuffer:
+    """
+    按基金分行的二维环形缓冲区。
+
+    - 每行一只基金，head 为下一次写入位置，count 为有效点数（不超过 capacity）
+    - 跨交易日时该基金的缓冲自动清空，只保留当日分时
+    - 与上一个点完全相同的估值不重复记录
+    """
+
+    def __init__(self, capacity: int = TICK_CAPACITY, max_funds: int = MAX_FUNDS):
+        self.capacity = capacity
+        self.max_funds = max_funds
+        self._rows: Dict[str, int] = {}
+        self._ts = np.zeros((0, capacity), dtype=np.int64)
+        self._gsz = np.zeros((0, capacity), dtype=np.float32)
+        self._zf = np.zeros((0, capacity), dtype=np.float32)
+        self._head = np.zeros(0, dtype=np.int64)
+        self._count = np.zeros(0, dtype=np.int64)
+        self._day = np.zeros(0, dtype=np.int64)
+        self._touched = np.zeros(0, dtype=np.float64)
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return self._ts.nbytes + self._gsz.nbytes + self._zf.nbytes
+
+    def _grow(self):
+        rows = min(max(8, len(self._head) * 2), self.max_funds)
+        extra = rows - len(self._head)
+        self._ts = np.vstack([self._ts, np.zeros((extra, self.capacity), dtype=np.int64)])
+        self._gsz = np.vstack([self._gsz, np.zeros((extra, self.capacity), dtype=np.float32)])
+        self._zf = np.vstack([self._zf, np.zeros((extra, self.capacity), dtype=np.float32)])
+        for name in ("_head", "_count", "_day", "_touched"):
+            old = getattr(self, name)
+            setattr(self, name, np.concatenate([old, np.zeros(extra, dtype=old.dtype)]))
+
+    def _slot(self, code: str) -> int:
+        row = self._rows.get(code)
+        if row is not None:
+            return row
+        if len(self._rows) == len(self._head):
+            if len(self._head) < self.max_funds:
+                self._grow()
+            else:
+                # 已满：复用最久未更新的基金
+                row = int(np.argmin(self._touched))
+                del self._rows[next(c for c, r in self._rows.items() if r == row)]
+        if row is None:
+            row = len(self._rows)
+        self._rows[code] = row
+        self._head[row] = self._count[row] = self._day[row] = 0
+        return row
+
+    def record(self, code, ts: float, gsz: float, zf: float):
+        self.record_many({code: (None, gsz, zf)}, ts)
+
+    def record_many(self, quotes: Dict[str, tuple], ts: float):
+        """写入一批行情（值为 fetch_quote 六元组或至少含前三项），同一时间戳"""
+        day = _market_day(ts)
+        with self._lock:
+            for code, quote in quotes.items():
+                i = self._slot(str(code).zfill(6))
+                gsz, zf = np.float32(quote[1]), np.float32(quote[2])
+                self._touched[i] = ts
+                if self._day[i] != day:
+                    self._day[i] = day
+                    self._head[i] = self._count[i] = 0
+                last = (self._head[i] - 1) % self.capacity
+                if self._count[i] and self._gsz[i, last] == gsz and self._zf[i, last] == zf:
+                    continue
+                pos = self._head[i]
+                self._ts[i, pos] = int(ts)
+                self._gsz[i, pos] = gsz
+                self._zf[i, pos] = zf
+                self._head[i] = (pos + 1) % self.capacity
+                self._count[i] = min(self._count[i] + 1, self.capacity)
+
+    def series(self, code) -> pd.DataFrame:
+        """单只基金当日分时，按时间升序，列为 估值 / 涨幅"""
+        code = str(code).zfill(6)
+        with self._lock:
+            i = self._rows.get(code)
+            if i is None or not self._count[i]:
+                return pd.DataFrame(columns=["估值", "涨幅"], dtype=float)
+            order = (self._head[i] - self._count[i] + np.arange(self._count[i])) % self.capacity
+            ts, gsz, zf = self._ts[i, order], self._gsz[i, order], self._zf[i, order]
+        index = pd.to_datetime(ts, unit="s", utc=True).tz_convert(MARKET_TZ)
+        return pd.DataFrame({"估值": gsz.astype(float), "涨幅": zf.astype(float)}, index=index)
+
+    def frame(self, codes: Iterable, field: str = "涨幅") -> pd.DataFrame:
+        """多只基金的同一字段按时间对齐（各基金更新时刻不同，缺口沿用前值）"""
+        columns = {}
+        for code in codes:
+            s = self.series(code)[field]
+            if len(s):
+                columns[str(code).zfill(6)] = s
+        if not columns:
+            return pd.DataFrame()
+        return pd.DataFrame(columns).sort_index().ffill()
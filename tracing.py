@@ -0,0 +1,167 @@
+# ============================
+# 轻量级耗时追踪
+# 每次页面重跑对应一个 Trace；span 记录 I/O 与计算阶段的耗时，incr 记录计数（如缓存命中）
+# 结果可在侧边栏调试面板查看，也可导出为 JSON lines 或 Prometheus 文本格式
+# ============================
+import functools
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+# 设置后，每次重跑结束时把 Trace 追加写入该文件（JSON lines）
+TRACE_FILE = os.environ.get("LUMILA_TRACE_FILE", "")
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("lumila_trace", default=None)
+_depth: ContextVar[int] = ContextVar("lumila_span_depth", default=0)
+
+# 进程级汇总（所有会话、所有重跑）
+_lock = threading.Lock()
+_span_totals: Dict[str, List[float]] = {}    # span 名 -> [次数, 总毫秒]
+_counter_totals: Counter = Counter()
+_recent: deque = deque(maxlen=200)
+
+
+class Trace:
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = time.time()
+        self.duration_ms: Optional[float] = None
+        self.spans: List[dict] = []
+        self.counters: Counter = Counter()
+        self._t0 = time.perf_counter()
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000
+
+    def totals(self) -> Dict[str, float]:
+        """按 span 名汇总本次重跑的耗时（毫秒）"""
+        out: Dict[str, float] = {}
+        for s in self.spans:
+            out[s["name"]] = out.get(s["name"], 0.0) + s["ms"]
+        return out
+
+    def to_dict(self) -> dict:
+        return {
+            "trace": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms if self.duration_ms is not None else self.elapsed_ms(),
+            "spans": self.spans,
+            "counters": dict(self.counters),
+        }
+
+
+def start_trace(name: str = "rerun") -> Trace:
+    trace = Trace(name)
+    _current.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def finish_trace(trace: Optional[Trace] = None) -> Optional[Trace]:
+    """结束 Trace 并计入进程级汇总（重复调用只生效一次）"""
+    trace = trace or _current.get()
+    if trace is None or trace.duration_ms is not None:
+        return trace
+    trace.duration_ms = trace.elapsed_ms()
+    with _lock:
+        _recent.append(trace)
+        total = _span_totals.setdefault(f"{trace.name}.total", [0, 0.0])
+        total[0] += 1
+        total[1] += trace.duration_ms
+    if TRACE_FILE:
+        try:
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(trace.to_dict(), ensure_ascii=False) + "\n")
+        except OSError:
+            pass
+    return trace
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """记录一段代码的耗时；没有当前 Trace 时只计入进程级汇总"""
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - start) * 1000
+        _depth.reset(token)
+        with _lock:
+            total = _span_totals.setdefault(name, [0, 0.0])
+            total[0] += 1
+            total[1] += ms
+        trace = _current.get()
+        if trace is not None:
+            trace.spans.append({
+                "name": name,
+                "start_ms": round(trace.elapsed_ms() - ms, 3),
+                "ms": round(ms, 3),
+                "depth": depth,
+                **attrs,
+            })
+
+
+def traced(name: str):
+    """把整个函数调用记为一个 span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def incr(name: str, n: int = 1):
+    if not n:
+        return
+    with _lock:
+        _counter_totals[name] += n
+    trace = _current.get()
+    if trace is not None:
+        trace.counters[name] += n
+
+
+# ============================
+# 导出
+# ============================
+def recent_traces() -> List[Trace]:
+    with _lock:
+        return list(_recent)
+
+
+def export_jsonl(traces: List[Trace]) -> str:
+    return "".join(json.dumps(t.to_dict(), ensure_ascii=False) + "\n" for t in traces)
+
+
+def export_prometheus() -> str:
+    """进程级汇总，Prometheus 文本格式"""
+    with _lock:
+        spans = {k: list(v) for k, v in _span_totals.items()}
+        counters = dict(_counter_totals)
+    lines = [
+        "# HELP lumila_span_seconds_total Total time spent in each span.",
+        "# TYPE lumila_span_seconds_total counter",
+    ]
+    lines += [f'lumila_span_seconds_total{{span="{k}"}} {v[1] / 1000:.6f}' for k, v in sorted(spans.items())]
+    lines += [
+        "# HELP lumila_span_calls_total Number of times each span ran.",
+        "# TYPE lumila_span_calls_total counter",
+    ]
+    lines += [f'lumila_span_calls_total{{span="{k}"}} {int(v[0])}' for k, v in sorted(spans.items())]
+    lines += [
+        "# HELP lumila_events_total Event counters such as cache hits and misses.",
+        "# TYPE lumila_events_total counter",
+    ]
+    lines += [f'lumila_events_total{{name="{k}"}} {v}' for k, v in sorted(counters.items())]
+    return "\n".join(lines) + "\n"
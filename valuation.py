@@ -0,0 +1,88 @@
+# ============================
+# 持仓估值（纯函数，不依赖 Streamlit / 网络）
+# 页面、AI 上下文、批处理任务共用同一套计算
+# ============================
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 份额低于该值视为已清仓，不参与估值
+MIN_SHARES = 0.01
+
+# fetch_quote 返回的六元组各字段
+QUOTE_COLUMNS = ["dwjz", "gsz", "gszzl", "name", "jzrq", "ok"]
+
+# 逐基金结果的列顺序（与页面表格一致，成本 / 现价 供下游使用）
+FUND_COLUMNS = ["代码", "基金名称", "占比", "持有金额", "涨幅", "当日收益", "累计收益", "收益率", "成本", "现价"]
+
+
+def quotes_to_frame(quotes: Dict[str, tuple]) -> pd.DataFrame:
+    """把 {代码: 行情六元组} 转为以 基金代码 为索引的行情表"""
+    df = pd.DataFrame.from_dict(quotes, orient="index", columns=QUOTE_COLUMNS)
+    df.index = df.index.astype(str).str.zfill(6)
+    df.index.name = "基金代码"
+    return df
+
+
+def value_portfolio(holdings: pd.DataFrame, quotes: pd.DataFrame,
+                    keep: Sequence[str] = ()) -> Tuple[pd.DataFrame, Dict[str, float]]:
+    """
+    按列向量一次算出逐基金与汇总指标。
+
+    holdings 需含 基金代码 / 持有份额 / 成本单价；quotes 为 quotes_to_frame 的结果。
+    keep 中的 holdings 列（如 账户）原样放在逐基金表最前面，供 totals_by 分组汇总。
+    返回 (逐基金表, {"total_v", "total_d", "total_h"})：
+    持有金额 = 份额 × 昨日净值，当日收益 = 持有金额 × 估算涨幅，累计收益 = (估值 - 成本) × 份额。
+    已清仓行不出现在结果中；成本为 0 的行收益率为 NaN。
+    行情缺失（ok 为假或 quotes 中没有）的基金各项金额为 NaN，不计入汇总，名称沿用持仓里的基金名称。
+    """
+    codes = holdings["基金代码"].astype(str).str.zfill(6).to_numpy()
+    shares = pd.to_numeric(holdings["持有份额"], errors='coerce').fillna(0).to_numpy(dtype=float)
+    cost = pd.to_numeric(holdings["成本单价"], errors='coerce').fillna(0).to_numpy(dtype=float)
+
+    q = quotes.reindex(codes)
+    priced = q["ok"].eq(True).to_numpy()
+    dwjz = np.where(priced, q["dwjz"].to_numpy(dtype=float), np.nan)
+    gsz = np.where(priced, q["gsz"].to_numpy(dtype=float), np.nan)
+    zf = np.where(priced, q["gszzl"].to_numpy(dtype=float), np.nan)
+    names = q["name"].to_numpy(dtype=object)
+    if "基金名称" in holdings.columns:
+        names = np.where(priced, names, holdings["基金名称"].to_numpy(dtype=object))
+
+    held = shares >= MIN_SHARES
+    yest_val = shares * dwjz
+    day_inc = yest_val * (zf / 100)
+    hold_inc = (gsz - cost) * shares
+    has_cost = cost > 0
+    rate = np.full(len(codes), np.nan)
+    rate[has_cost] = (gsz[has_cost] - cost[has_cost]) / cost[has_cost] * 100
+
+    total_v = float(np.nansum(yest_val[held]))
+    total_d = float(np.nansum(day_inc[held]))
+    total_h = float(np.nansum(hold_inc[held]))
+    portion = yest_val / total_v * 100 if total_v > 0 else np.zeros(len(codes))
+
+    funds = pd.DataFrame({
+        "代码": codes,
+        "基金名称": names,
+        "占比": portion,
+        "持有金额": yest_val,
+        "涨幅": zf,
+        "当日收益": day_inc,
+        "累计收益": hold_inc,
+        "收益率": rate,
+        "成本": cost,
+        "现价": gsz,
+    }, columns=FUND_COLUMNS)[held].reset_index(drop=True)
+    for i, col in enumerate(keep):
+        funds.insert(i, col, holdings[col].to_numpy()[held])
+
+    return funds, {"total_v": total_v, "total_d": total_d, "total_h": total_h}
+
+
+def totals_by(funds: pd.DataFrame, key: str) -> pd.DataFrame:
+    """按 key 列（如 账户）汇总逐基金表，列名与 value_portfolio 的汇总一致"""
+    return funds.groupby(key, sort=False)[["持有金额", "当日收益", "累计收益"]].sum().rename(
+        columns={"持有金额": "total_v", "当日收益": "total_d", "累计收益": "total_h"}
+    )